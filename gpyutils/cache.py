@@ -0,0 +1,59 @@
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import collections
+import json
+import os
+import tempfile
+import typing
+from pathlib import Path
+
+
+def get_cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = Path.home() / ".cache"
+    return Path(cache_home) / "gpyutils"
+
+
+class JSONCache(collections.UserDict):
+    """
+    A dict that is persistently stored as a JSON file
+
+    The cache is loaded on construction, and written back via save()
+    or on successful exit from the context manager.  If the cache file
+    is missing, corrupted or has a different format version, the cache
+    starts empty.  If name is None, the cache is not persistent.
+    """
+
+    def __init__(self, name: str | None, version: int = 1) -> None:
+        super().__init__()
+        self.path = None
+        self.version = version
+        if name is None:
+            return
+        self.path = get_cache_dir() / f"{name}.json"
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == version:
+            self.update(data["data"])
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.save()
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                "w", dir=self.path.parent, delete=False) as f:
+            json.dump({"version": self.version, "data": self.data}, f)
+        os.rename(f.name, self.path)
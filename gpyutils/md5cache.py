@@ -0,0 +1,40 @@
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Direct access to metadata/md5-cache entries of ebuild repositories"""
+
+import os.path
+
+
+def parse_md5_cache(data: str) -> dict[str, str]:
+    r"""
+    Parse a md5-cache entry into a dict.
+
+    >>> parse_md5_cache("EAPI=8\nBDEPEND=dev-python/gpep517 a/b=\n_md5_=12")
+    {'EAPI': '8', 'BDEPEND': 'dev-python/gpep517 a/b=', '_md5_': '12'}
+    """
+    return dict(x.split("=", 1) for x in data.splitlines() if "=" in x)
+
+
+def get_md5_cache_path(ebuild_path: str) -> str:
+    """
+    Get the md5-cache entry path corresponding to the ebuild path.
+
+    >>> get_md5_cache_path("/repo/dev-python/foo/foo-1.ebuild")
+    '/repo/metadata/md5-cache/dev-python/foo-1'
+    """
+    pkg_dir, ebuild = os.path.split(ebuild_path)
+    cat_dir = os.path.dirname(pkg_dir)
+    return os.path.join(os.path.dirname(cat_dir), "metadata", "md5-cache",
+                        os.path.basename(cat_dir),
+                        ebuild.removesuffix(".ebuild"))
+
+
+def read_md5_cache(pkg) -> dict[str, str] | None:
+    """Read the md5-cache entry for pkg, None if it is not available"""
+    try:
+        with open(get_md5_cache_path(pkg.path)) as f:
+            return parse_md5_cache(f.read())
+    except FileNotFoundError:
+        return None
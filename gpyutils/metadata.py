@@ -0,0 +1,168 @@
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Package metadata.xml access and repository-wide maintainer index"""
+
+import concurrent.futures
+import os
+import typing
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from .cache import JSONCache
+
+
+def find_metadata_xml(path: Path) -> typing.Generator[Path, None, None]:
+    """Find metadata.xml files of all packages in path"""
+    for dirpath, dirnames, filenames in os.walk(path):
+        if "metadata.xml" in filenames and any(
+                x.endswith(".ebuild") for x in filenames):
+            # package directory, do not descend into files/ etc.
+            dirnames.clear()
+            yield Path(dirpath) / "metadata.xml"
+            continue
+
+        categories_path = Path(dirpath) / "profiles" / "categories"
+        if categories_path.exists():
+            # repository top directory, descend into categories only
+            with open(categories_path) as f:
+                categories = frozenset(x.strip() for x in f)
+            dirnames[:] = [x for x in dirnames if x in categories]
+        else:
+            dirnames[:] = [x for x in dirnames if not x.startswith(".")]
+
+
+def get_maintainers(path: str) -> list[str]:
+    """
+    Get maintainer e-mails from metadata.xml, in order
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile("w", suffix=".xml") as f:
+    ...     _ = f.write('''<pkgmetadata>
+    ...       <maintainer type="person"><email>a@example.com</email>
+    ...       </maintainer>
+    ...       <maintainer type="project"><email>python@gentoo.org</email>
+    ...       </maintainer>
+    ...       <upstream><maintainer><email>up@example.com</email>
+    ...       </maintainer></upstream>
+    ...     </pkgmetadata>''')
+    ...     f.flush()
+    ...     get_maintainers(f.name)
+    ['a@example.com', 'python@gentoo.org']
+    """
+    try:
+        xml = ET.parse(path)
+    except (OSError, ET.ParseError):
+        return []
+    # dict is used as an ordered set
+    ret = {x.text.strip(): None for x in xml.iterfind("maintainer/email")
+           if x.text}
+    return list(ret)
+
+
+def herd_email(herd: str) -> str:
+    """
+    Get the e-mail of the project that replaced a herd
+
+    >>> herd_email("python")
+    'python@gentoo.org'
+    >>> herd_email("sci@gentoo.org")
+    'sci@gentoo.org'
+    """
+    if "@" in herd:
+        return herd
+    return f"{herd}@gentoo.org"
+
+
+def harvest_metadata_xml(paths: typing.Iterable[Path | str],
+                         parse_func: typing.Callable[[str], typing.Any],
+                         cache_name: str | None = None,
+                         jobs: int | None = None,
+                         ) -> dict[str, typing.Any]:
+    """
+    Parse all metadata.xml files in paths, return path -> parse_func result
+
+    Files are parsed in parallel, and the results are cached by mtime
+    in the cache_name cache, so only the files that changed are parsed
+    on subsequent runs.  The cache entries for the scanned paths are
+    replaced, to drop removed packages, and the entries for other paths
+    are kept.  If cache_name is None, the cache is not used.  parse_func
+    must be picklable, and its results must be JSON-serializable.
+    """
+    paths = [os.path.abspath(x) for x in paths]
+    # cache: path -> (mtime, parse_func result)
+    cache = JSONCache(cache_name)
+    entries = {}
+    to_parse = []
+    for path in paths:
+        for metadata_xml in find_metadata_xml(Path(path)):
+            key = str(metadata_xml)
+            mtime = metadata_xml.stat().st_mtime_ns
+            cached = cache.get(key)
+            if cached is not None and cached[0] == mtime:
+                entries[key] = cached
+            else:
+                entries[key] = (mtime, None)
+                to_parse.append(key)
+
+    if to_parse:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            for key, value in zip(to_parse,
+                                  executor.map(parse_func, to_parse,
+                                               chunksize=64)):
+                entries[key] = (entries[key][0], value)
+
+    prefixes = tuple(os.path.join(x, "") for x in paths)
+    for key in [x for x in cache if x.startswith(prefixes)]:
+        del cache[key]
+    cache.update(entries)
+    cache.save()
+
+    return {key: value for key, (_, value) in entries.items()}
+
+
+class MaintainerIndex:
+    """
+    Maintainers of all packages in a repository
+
+    The index is built from all metadata.xml files on construction,
+    using harvest_metadata_xml().  If use_cache is False, the cache
+    is neither used nor updated.
+    """
+
+    def __init__(self, repo_path: str, jobs: int | None = None,
+                 use_cache: bool = True) -> None:
+        # package -> maintainers
+        self.packages = {}
+        # maintainer -> packages
+        self.maintainer_packages = {}
+
+        entries = harvest_metadata_xml(
+            [repo_path], get_maintainers,
+            cache_name="maintainers" if use_cache else None, jobs=jobs)
+        for key, maintainers in sorted(entries.items()):
+            pkg_dir = Path(key).parent
+            pkg = f"{pkg_dir.parent.name}/{pkg_dir.name}"
+            self.packages[pkg] = maintainers
+            for m in maintainers:
+                self.maintainer_packages.setdefault(m, []).append(pkg)
+
+    def maintainers(self, pkg: str) -> list[str]:
+        """Get maintainers of package (category/name)"""
+        return self.packages.get(str(pkg), [])
+
+    def packages_of(self, maintainer: str) -> list[str]:
+        """Get packages (category/name) maintained by maintainer"""
+        return self.maintainer_packages.get(maintainer, [])
+
+    def filter(self, pkgs, maintainers: typing.Iterable[str]):
+        """
+        Filter package set to packages maintained by any of maintainers
+
+        The filter uses only package keys, so no package metadata needs
+        to be loaded for packages that do not match.
+        """
+        keys = frozenset(pkg for maint in maintainers
+                         for pkg in self.packages_of(maint))
+        return pkgs.filter(lambda p: str(p.key) in keys)
@@ -0,0 +1,162 @@
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import csv
+import json
+import sys
+import typing
+
+
+class JSONWriter:
+    """
+    Stream records as a JSON array, one record per line.
+
+    >>> import io
+    >>> f = io.StringIO()
+    >>> with JSONWriter(f) as w:
+    ...     w.write({"a": 1})
+    ...     w.write({"b": 2})
+    >>> print(f.getvalue(), end="")
+    [
+    {"a": 1},
+    {"b": 2}
+    ]
+    >>> f = io.StringIO()
+    >>> with JSONWriter(f) as w:
+    ...     pass
+    >>> print(f.getvalue(), end="")
+    []
+    """
+
+    def __init__(self, file: typing.TextIO = sys.stdout) -> None:
+        self.file = file
+        self.first = True
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.file.write("[]\n" if self.first else "\n]\n")
+
+    def write(self, record: dict) -> None:
+        self.file.write("[\n" if self.first else ",\n")
+        json.dump(record, self.file)
+        self.first = False
+
+
+class JSONLinesWriter:
+    """
+    Stream records as JSON lines.
+
+    >>> import io
+    >>> f = io.StringIO()
+    >>> with JSONLinesWriter(f) as w:
+    ...     w.write({"a": 1})
+    ...     w.write({"b": 2})
+    >>> print(f.getvalue(), end="")
+    {"a": 1}
+    {"b": 2}
+    """
+
+    def __init__(self, file: typing.TextIO = sys.stdout) -> None:
+        self.file = file
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+    def write(self, record: dict) -> None:
+        json.dump(record, self.file)
+        self.file.write("\n")
+
+
+class CSVWriter:
+    """
+    Stream records as CSV, with the header taken from the first record.
+    List values are joined using spaces.
+
+    >>> import io
+    >>> f = io.StringIO()
+    >>> with CSVWriter(f) as w:
+    ...     w.write({"a": 1, "b": "x"})
+    ...     w.write({"a": 2, "b": ["y,z", "w"]})
+    >>> for line in f.getvalue().splitlines():
+    ...     print(line)
+    a,b
+    1,x
+    2,"y,z w"
+    """
+
+    def __init__(self, file: typing.TextIO = sys.stdout) -> None:
+        self.file = file
+        self.writer = None
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+    def write(self, record: dict) -> None:
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(record))
+            self.writer.writeheader()
+        self.writer.writerow({k: " ".join(v) if isinstance(v, list) else v
+                              for k, v in record.items()})
+
+
+class ColumnarWriter:
+    """
+    Stream records in columnar batches, one JSON object per line.
+
+    Every line maps field names to lists of values for up to batch_size
+    records, similarly to row groups in columnar formats.
+
+    >>> import io
+    >>> f = io.StringIO()
+    >>> with ColumnarWriter(f, batch_size=2) as w:
+    ...     for i in range(3):
+    ...         w.write({"a": i, "b": str(i)})
+    >>> print(f.getvalue(), end="")
+    {"a": [0, 1], "b": ["0", "1"]}
+    {"a": [2], "b": ["2"]}
+    """
+
+    def __init__(self, file: typing.TextIO = sys.stdout,
+                 batch_size: int = 1024) -> None:
+        self.file = file
+        self.batch_size = batch_size
+        self.columns = {}
+        self.count = 0
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+        if self.count == 0:
+            return
+        json.dump(self.columns, self.file)
+        self.file.write("\n")
+        self.columns = {}
+        self.count = 0
+
+    def write(self, record: dict) -> None:
+        for k, v in record.items():
+            self.columns.setdefault(k, []).append(v)
+        self.count += 1
+        if self.count >= self.batch_size:
+            self.flush()
+
+
+record_writers = {
+    "json": JSONWriter,
+    "jsonl": JSONLinesWriter,
+    "csv": CSVWriter,
+    "columnar": ColumnarWriter,
+}
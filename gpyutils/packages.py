@@ -4,6 +4,8 @@
 
 import enum
 
+from gentoopm.basepm.atom import PMAtom
+
 from .implementations import Status, get_python_impls
 
 
@@ -23,6 +25,48 @@ def get_package_class(pkg):
         return PackageClass.non_keyworded
 
 
+def get_keywords_class(keywords, arches=None):
+    """
+    Get package class for keywords, optionally considering only
+    the specified arches.  Negative keywords are ignored.
+
+    >>> get_keywords_class(["amd64", "~arm64", "-x86"])
+    <PackageClass.stable: 3>
+    >>> get_keywords_class(["amd64", "~arm64"], arches=["arm64"])
+    <PackageClass.testing: 2>
+    >>> get_keywords_class(["-*"])
+    <PackageClass.non_keyworded: 1>
+    """
+    ret = PackageClass.non_keyworded
+    for x in keywords:
+        if x.startswith("-"):
+            continue
+        if arches is not None and x.lstrip("~") not in arches:
+            continue
+        if not x.startswith("~"):
+            return PackageClass.stable
+        ret = PackageClass.testing
+    return ret
+
+
+def get_newest_keyworded(pkgs, arches=None):
+    """
+    Build an index of the newest keyworded version of every package
+    in pkgs, as key -> (package, PackageClass) mapping.  Packages are
+    processed in a single pass, without sorting them.
+    """
+    ret = {}
+    for p in pkgs:
+        cls = get_keywords_class(p.keywords, arches)
+        if cls == PackageClass.non_keyworded:
+            continue
+        key = str(p.key)
+        prev = ret.get(key)
+        if prev is None or p > prev[0]:
+            ret[key] = (p, cls)
+    return ret
+
+
 def group_packages(pkgs, key="key", verbose=True):
     prev_key = None
     curr = []
@@ -39,38 +83,110 @@ def group_packages(pkgs, key="key", verbose=True):
         yield curr
 
 
-def find_redundant(pkgs):
+class BitEncoder:
+    """
+    Assign consecutive bits to values, as they are encountered.
+
+    >>> enc = BitEncoder()
+    >>> bin(enc.encode(["a", "b"])), bin(enc.encode(["c", "a"]))
+    ('0b11', '0b101')
+    """
+
+    def __init__(self):
+        self.bits = {}
+
+    def encode(self, values):
+        bits = self.bits
+        mask = 0
+        for v in values:
+            bit = bits.get(v)
+            if bit is None:
+                bit = bits[v] = 1 << len(bits)
+            mask |= bit
+        return mask
+
+
+def redundant_mask(testing, stable, impls):
+    """
+    Compute redundancy for a version-sorted group of packages, given
+    per-package bitmasks of keywords (testing and stable, where every
+    stable keyword is also included in testing) and implementations.
+    Returns a list of bools, indicating whether the respective package
+    is redundant, i.e. there is a newer package with a superset
+    of keywords and implementations.  Packages that have no keywords
+    (i.e. live ebuilds) are never redundant.
+
+    >>> redundant_mask([0b11, 0b01, 0b11, 0b11],
+    ...                [0b00, 0b00, 0b01, 0b00],
+    ...                [0b01, 0b100, 0b10, 0b11])
+    [True, False, False, False]
+    >>> redundant_mask([0b01, 0b00], [0b00, 0b00], [0b00, 0b01])
+    [False, False]
+    """
+    ret = [False] * len(testing)
+    max_testing = max_stable = max_impls = 0
+    for i in reversed(range(len(testing))):
+        if (testing[i] and not testing[i] & ~max_testing
+                and not stable[i] & ~max_stable
+                and not impls[i] & ~max_impls):
+            ret[i] = True
+        max_testing |= testing[i]
+        max_stable |= stable[i]
+        max_impls |= impls[i]
+    return ret
+
+
+def find_redundant(pkgs, keyword_bits=None, impl_bits=None):
     """
     Find redundant packages in the group, i.e. those that have newer
     versions with a superset of keywords and implementations.
+
+    keyword_bits and impl_bits can be used to pass BitEncoder instances
+    that are shared across multiple calls.
     """
-    max_keywords = {}
-    max_impls = set()
-    for p in reversed(pkgs):
-        redundant = True
-
-        # live ebuilds are never redundant
-        if not p.keywords:
-            redundant = False
-
-        # first, determine non-redundancy via keywords
-        for k in p.keywords:
-            if k.startswith("~"):
-                v = 1
-                k = k[1:]
-            else:  # stable
-                v = 2
-
-            if max_keywords.get(k, 0) < v:
-                max_keywords[k] = v
-                redundant = False
-
-        # then determine non-redundancy via impls
-        impls = {i for i in get_python_impls(p) or ()
-                 if i.status not in (Status.dead, Status.future)}
-        if not max_impls.issuperset(impls):
-            redundant = False
-            max_impls.update(impls)
-
-        if redundant:
+    if keyword_bits is None:
+        keyword_bits = BitEncoder()
+    if impl_bits is None:
+        impl_bits = BitEncoder()
+
+    testing = []
+    stable = []
+    impls = []
+    for p in pkgs:
+        testing.append(keyword_bits.encode(k.lstrip("~") for k in p.keywords))
+        stable.append(keyword_bits.encode(k for k in p.keywords
+                                          if not k.startswith("~")))
+        impls.append(impl_bits.encode(
+            i for i in get_python_impls(p) or ()
+            if i.status not in (Status.dead, Status.future)))
+
+    redundant = redundant_mask(testing, stable, impls)
+    # yield newest first, as we used to
+    for p, r in zip(reversed(pkgs), reversed(redundant)):
+        if r:
             yield p
+
+
+def find_all_redundant(pkgs):
+    """Find redundant packages in all slots of pkgs"""
+    keyword_bits = BitEncoder()
+    impl_bits = BitEncoder()
+    for pg in group_packages(pkgs.sorted, "slotted_atom"):
+        yield from find_redundant(pg, keyword_bits, impl_bits)
+
+
+def iter_dep_atoms(p):
+    """Yield all dependency atoms of p, flattening any groups"""
+    dep_groups = [p.run_dependencies, p.build_dependencies,
+                  p.post_dependencies]
+    if hasattr(p, "cbuild_build_dependencies"):
+        dep_groups.append(p.cbuild_build_dependencies)
+    stack = [iter(dg) for dg in reversed(dep_groups)]
+    while stack:
+        dep = next(stack[-1], None)
+        if dep is None:
+            stack.pop()
+        elif isinstance(dep, PMAtom):
+            yield dep
+        else:
+            stack.append(iter(dep))
@@ -130,6 +130,10 @@ class PythonCompat:
         self.nodes.append(n)
 
     def add(self, impl_name):
+        # already there, nothing to do
+        if any(x.full_name == impl_name for x in self):
+            return
+
         # first, try adding to an existing group
         # longer groups come first, so that should be good enough
         for g in self.groups:
@@ -352,6 +356,8 @@ def add_impl(s, new):
     'python3_{10..13} python3_{13..15}t'
     >>> add_impl('python3_10', 'python3_11')
     'python3_{10,11}'
+    >>> add_impl('python3_{10..13} python3_13t', 'python3_13t')
+    'python3_{10..13} python3_13t'
     """
     pc = parse(s)
     pc.add(new)
@@ -448,7 +454,16 @@ class EbuildMangler:
         else:
             raise KeyError("Unable to find PYTHON_COMPAT in %s" % path)
 
-    def write(self):
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def original_data(self):
+        return self._data
+
+    def stage(self):
+        """Write the updated ebuild to a temporary file and return its path"""
         data = "".join((self._data[:self._start],
                         "PYTHON_COMPAT=(", str(self._value), ")",
                         self._data[self._end:]))
@@ -459,7 +474,10 @@ class EbuildMangler:
             f.write(data.encode("utf8"))
 
         shutil.copymode(self._path, tmp_path)
-        os.rename(tmp_path, self._path)
+        return tmp_path
+
+    def write(self):
+        os.rename(self.stage(), self._path)
 
     def __enter__(self):
         return self
@@ -12,6 +12,7 @@ from gentoopm import get_package_manager
 from gentoopm.basepm.atom import PMAtom
 
 from gpyutils.ansi import ANSI
+from gpyutils.metadata import MaintainerIndex
 
 
 @dataclasses.dataclass
@@ -162,14 +163,15 @@ class PackageSource:
 class MaintainerMarker:
     """ Class providing node marking based on maintainer. """
 
-    def __init__(self, maintainers):
-        self.maintainers = frozenset(maintainers)
+    def __init__(self, maintainers, index=None):
+        self.packages = frozenset()
+        if maintainers:
+            self.packages = frozenset(
+                pkg for maint in maintainers
+                for pkg in index.packages_of(maint))
 
     def should_mark(self, p):
-        for maint in p.maintainers:
-            if maint.email in self.maintainers:
-                return True
-        return False
+        return str(p.key) in self.packages
 
 
 def process(pkgsrc, pkgs, processor, marker):
@@ -270,8 +272,11 @@ def main(prog_name, *argv):
             all_packages.add(x.strip())
 
     pkgsrc = PackageSource(vals.repo, vals.usedep_only)
+    index = None
+    if vals.mark_maint:
+        index = MaintainerIndex(pkgsrc.repo.path)
     process(pkgsrc, all_packages, vals.proc_cls,
-            MaintainerMarker(vals.mark_maint))
+            MaintainerMarker(vals.mark_maint, index))
 
     return 0
 
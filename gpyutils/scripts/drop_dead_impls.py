@@ -17,6 +17,7 @@ from gpyutils.implementations import (
     get_python_impls,
     read_implementations,
 )
+from gpyutils.metadata import MaintainerIndex, herd_email
 from gpyutils.packages import group_packages
 from gpyutils.pycompat import EbuildMangler
 
@@ -87,16 +88,29 @@ def main(prog_name, *argv):
     opt.add_option("-f", "--fix", action="store_true",
                    dest="fix", default=False,
                    help="Automatically update PYTHON_COMPAT")
+    opt.add_option("--herd", action="append",
+                   dest="herd", default=[],
+                   help="Include only packages maintained by specified "
+                        "project (formerly herd), e.g. python")
+    opt.add_option("--maintainer", action="append",
+                   dest="maintainer", default=[],
+                   help="Include only packages maintained by specified "
+                        "person/project (by e-mail)")
     opt.add_option("-r", "--repo",
                    dest="repo", default="gentoo",
                    help="Work on given repository (default: gentoo)")
     vals, argv = opt.parse_args(list(argv))
 
-    if not argv:
-        process(pm.repositories[vals.repo], fix=vals.fix)
-    else:
-        for pkg in argv:
-            process(pm.repositories[vals.repo].filter(pkg), fix=vals.fix)
+    repo = pm.repositories[vals.repo]
+    maint_index = None
+    maint_filter = [*vals.maintainer, *map(herd_email, vals.herd)]
+    if maint_filter:
+        maint_index = MaintainerIndex(repo.path)
+
+    for pkgs in ([repo.filter(pkg) for pkg in argv] or [repo]):
+        if maint_index is not None:
+            pkgs = maint_index.filter(pkgs, maint_filter)
+        process(pkgs, fix=vals.fix)
 
     return 0
 
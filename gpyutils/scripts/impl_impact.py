@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import argparse
+import collections
+import sys
+
+import gentoopm.exceptions
+from gentoopm import get_package_manager
+
+from gpyutils.ansi import ANSI
+from gpyutils.implementations import (
+    Status,
+    get_impl_by_name,
+    get_python_impls,
+    implementations,
+    read_implementations,
+)
+from gpyutils.output import record_writers
+from gpyutils.packages import group_packages, iter_dep_atoms
+
+USEDEP_PREFIXES = ("python_targets_", "python_single_target_")
+
+
+def get_impl_mask(impls, statuses=None):
+    """
+    Get a bitmask of impls, with bit N corresponding to N-th implementation
+    in implementations.txt.  If statuses is not None, only implementations
+    with one of the specified statuses are included.
+    """
+    mask = 0
+    for bit, i in enumerate(implementations):
+        if i in impls and (statuses is None or i.status in statuses):
+            mask |= 1 << bit
+    return mask
+
+
+def get_usedep_mask(dep):
+    """Get a bitmask of implementations in PYTHON_USEDEP of dep"""
+    _, _, usedep = str(dep).partition("[")
+    names = set()
+    for flag in usedep.rstrip("]").split(","):
+        # skip negative flags, they do not add requirements
+        if flag.startswith(("-", "!")):
+            continue
+        flag = flag.split("(", 1)[0].rstrip("?=")
+        for prefix in USEDEP_PREFIXES:
+            if flag.startswith(prefix):
+                names.add(flag.removeprefix(prefix))
+    return get_impl_mask([i for i in implementations if i.r1_name in names])
+
+
+class ImplGraph:
+    """
+    Python packages (newest version of every slot), their implementations
+    and PYTHON_USEDEP dependencies, stored as bitmasks
+    """
+
+    def __init__(self):
+        self.impls = {}
+        # node -> [(dependency node, impl mask), ...]
+        self.deps = collections.defaultdict(list)
+        self.rdeps = collections.defaultdict(set)
+
+    def load(self, repo):
+        atom_cache = {}
+        pkgs = []
+
+        sys.stderr.write(f"{ANSI.clear_line}{ANSI.brown}Waiting for PM "
+                         f"to start iterating...{ANSI.reset}\r")
+
+        for pg in group_packages(repo.sorted, "slotted_atom"):
+            p = pg[-1]
+            impls = get_python_impls(p)
+            if impls is None:
+                continue
+
+            sys.stderr.write(f"{ANSI.clear_line}{ANSI.green}"
+                             f"{p.slotted_atom!s:<56}{ANSI.reset} "
+                             f"({ANSI.white}{len(pkgs):5d}{ANSI.reset} "
+                             "packages)\r")
+            self.impls[str(p.slotted_atom)] = get_impl_mask(impls)
+            pkgs.append(p)
+
+        for p in pkgs:
+            node = str(p.slotted_atom)
+            for dep in iter_dep_atoms(p):
+                if dep.blocking:
+                    continue
+                mask = get_usedep_mask(dep)
+                if not mask:
+                    continue
+
+                matcher = str(dep).partition("[")[0]
+                if matcher not in atom_cache:
+                    try:
+                        atom_cache[matcher] = str(
+                            repo.select(matcher).slotted_atom)
+                    except (gentoopm.exceptions.EmptyPackageSetError,
+                            gentoopm.exceptions.AmbiguousPackageSetError):
+                        atom_cache[matcher] = None
+                dep_node = atom_cache[matcher]
+                if dep_node not in self.impls or dep_node == node:
+                    continue
+
+                self.deps[node].append((dep_node, mask))
+                self.rdeps[dep_node].add(node)
+
+        sys.stderr.write(f"{ANSI.clear_line}{ANSI.white}Loaded {len(pkgs)} "
+                         f"packages.{ANSI.reset}\n")
+
+    def propagate(self, usable):
+        """Get effective implementations, given a mask of usable ones"""
+        return propagate(self.impls, self.deps, self.rdeps, usable)
+
+    def blast_radius(self, node, affected):
+        """Count affected packages depending on node, transitively"""
+        seen = {node}
+        queue = collections.deque([node])
+        while queue:
+            for rdep in self.rdeps[queue.popleft()]:
+                if rdep in affected and rdep not in seen:
+                    seen.add(rdep)
+                    queue.append(rdep)
+        return len(seen) - 1
+
+
+def propagate(impls, deps, rdeps, usable):
+    """
+    Compute effective implementations of all packages.
+
+    A package can only use implementations that are usable, and that are
+    supported by all its dependencies whose PYTHON_USEDEP requires them.
+    The restrictions are propagated to reverse dependencies until
+    a fixed point is reached.
+
+    >>> impls = {"a": 0b111, "b": 0b011, "c": 0b110}
+    >>> deps = {"a": [("b", 0b111)], "b": [("c", 0b011)]}
+    >>> rdeps = {"b": {"a"}, "c": {"b"}}
+    >>> {k: bin(v) for k, v in propagate(impls, deps, rdeps, 0b111).items()}
+    {'a': '0b10', 'b': '0b10', 'c': '0b110'}
+    >>> {k: bin(v) for k, v in propagate(impls, deps, rdeps, 0b101).items()}
+    {'a': '0b0', 'b': '0b0', 'c': '0b100'}
+    """
+    effective = {node: mask & usable for node, mask in impls.items()}
+    queue = collections.deque(effective)
+    queued = set(queue)
+    while queue:
+        node = queue.popleft()
+        queued.remove(node)
+        mask = effective[node]
+        for dep, usedep in deps.get(node, ()):
+            mask &= ~(usedep & ~effective[dep])
+        if mask != effective[node]:
+            effective[node] = mask
+            for rdep in rdeps.get(node, ()):
+                if rdep not in queued:
+                    queued.add(rdep)
+                    queue.append(rdep)
+    return effective
+
+
+def impl_names(mask):
+    return [i.short_name for bit, i in enumerate(implementations)
+            if mask & (1 << bit)]
+
+
+def parse_change(arg):
+    try:
+        impl, status = arg.split("=")
+        return (get_impl_by_name(impl), Status[status])
+    except (KeyError, ValueError):
+        raise ValueError(
+            f"invalid change {arg!r}, expected <impl>=<status> with "
+            f"status one of: {', '.join(x.name for x in Status)}",
+        ) from None
+
+
+def main(prog_name, *argv):
+    argp = argparse.ArgumentParser(prog=prog_name)
+    argp.add_argument("-f", "--format",
+                      choices=["text", *record_writers],
+                      default="text",
+                      help="Output format (default: text)")
+    argp.add_argument("-r", "--repo",
+                      default="gentoo",
+                      help="Work on given repository (default: gentoo)")
+    argp.add_argument("change",
+                      nargs="+",
+                      help="Status change to simulate, as <impl>=<status>, "
+                           "e.g. python3_11=dead")
+    args = argp.parse_args(list(argv))
+
+    pm = get_package_manager()
+    read_implementations(pm)
+
+    unusable = (Status.dead, Status.future)
+    current = get_impl_mask(implementations,
+                            [x for x in Status if x not in unusable])
+    simulated = current
+    for arg in args.change:
+        try:
+            impl, status = parse_change(arg)
+        except ValueError as e:
+            argp.error(str(e))
+        bit = 1 << implementations.index(impl)
+        if status in unusable:
+            simulated &= ~bit
+        else:
+            simulated |= bit
+
+    graph = ImplGraph()
+    graph.load(pm.repositories[args.repo])
+
+    before = graph.propagate(current)
+    after = graph.propagate(simulated)
+    affected = {node: before[node] & ~after[node] for node in before
+                if before[node] & ~after[node]}
+
+    records = sorted(
+        ({"package": node,
+          "lost": impl_names(lost),
+          "remaining": impl_names(after[node]),
+          "direct": bool(lost & ~simulated),
+          "blast_radius": graph.blast_radius(node, affected),
+          } for node, lost in affected.items()),
+        key=lambda x: (-x["blast_radius"], x["package"]))
+
+    if args.format == "text":
+        for record in records:
+            if not record["remaining"]:
+                status = f"{ANSI.red}no implementations left{ANSI.reset}"
+            elif record["direct"]:
+                status = f"{ANSI.brown}loses implementations{ANSI.reset}"
+            else:
+                status = f"{ANSI.brown}loses via dependencies{ANSI.reset}"
+            print(f"{record['package']:<40} {status} "
+                  f"(lost: {' '.join(record['lost'])}, "
+                  f"blast radius: {record['blast_radius']})")
+        sys.stderr.write(f"{ANSI.white}{len(records)} packages affected."
+                         f"{ANSI.reset}\n")
+    else:
+        with record_writers[args.format](sys.stdout) as writer:
+            for record in records:
+                writer.write(record)
+
+    return 0
+
+
+def entry_point():
+    sys.exit(main(*sys.argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
@@ -4,14 +4,20 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import argparse
+import collections
+import concurrent.futures
 import dataclasses
 import itertools
+import operator
 import os
+import re
 import sys
 import typing
 
 import lxml.etree
 
+EPYTHON_RE = re.compile(r"python\d+\.\d+t?|pypy\d*(?:\.\d+)?")
+
 
 @dataclasses.dataclass(frozen=True, order=True)
 class TestCase:
@@ -77,16 +83,58 @@ class TestCase:
                               failed=self.failed)
 
 
+def iter_test_cases(path: str) -> typing.Generator[TestCase, None, None]:
+    """
+    Read test cases from junit xml file
+
+    The file is parsed incrementally, and elements are freed as soon
+    as they are processed, so that the memory use does not depend
+    on the number of test cases or the size of captured output.
+    """
+    for _, element in lxml.etree.iterparse(
+        path,
+        tag=("testcase", "system-out", "system-err", "failure", "error"),
+        huge_tree=True,
+    ):
+        if element.tag != "testcase":
+            # drop captured output and tracebacks, we only need the tag
+            element.clear(keep_tail=True)
+            continue
+
+        yield TestCase.from_xml(element)
+        element.clear(keep_tail=True)
+        # remove already processed siblings from the tree
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def all_failed_by(all_tests: typing.Iterable[TestCase],
+                  key: typing.Callable[[TestCase], typing.Hashable],
+                  ) -> dict[typing.Hashable, bool]:
+    """
+    Map each key to whether all tests with that key have failed
+
+    >>> all_failed_by([TestCase("a", "x", "a.py", True),
+    ...                TestCase("a", "y", "a.py", False),
+    ...                TestCase("b", "z", "b.py", True)],
+    ...               key=lambda x: x.path)
+    {'a.py': False, 'b.py': True}
+    """
+    ret = {}
+    for x in all_tests:
+        k = key(x)
+        ret[k] = ret.get(k, True) and x.failed
+    return ret
+
+
 def combine_files(failing_tests: list[TestCase],
                   all_tests: set[TestCase],
                   ) -> typing.Generator[TestCase, None, None]:
+    all_failed = all_failed_by(all_tests, key=lambda x: x.path)
     for path, group in itertools.groupby(
         failing_tests, key=lambda x: x.path,
     ):
-        if all(
-            x.failed for x in all_tests
-            if x.path == path
-        ):
+        if all_failed[path]:
             first = next(group)
             yield TestCase(class_ref=None,
                            name=None,
@@ -99,45 +147,116 @@ def combine_files(failing_tests: list[TestCase],
 def combine_classes(failing_tests: list[TestCase],
                     all_tests: set[TestCase],
                     ) -> typing.Generator[TestCase, None, None]:
+    all_failed = all_failed_by(all_tests, key=lambda x: x.class_ref)
     for class_ref, group in itertools.groupby(
         failing_tests, key=lambda x: x.class_ref,
     ):
-        if all(
-            x.failed for x in all_tests
-            if x.class_ref == class_ref
-        ):
-            first = next(group)
+        items = list(group)
+        first = items[0]
+        # combined files and global functions can not be combined
+        # into a class selector
+        if (first.class_ref is not None and first.class_name is not None
+                and all_failed[class_ref]):
             yield TestCase(class_ref=first.class_ref,
                            name=None,
                            path=first.path,
                            failed=first.failed)
             continue
-        yield from group
+        yield from items
 
 
 def combine_parameters(failing_tests: list[TestCase],
                        all_tests: set[TestCase],
                        ) -> typing.Generator[TestCase, None, None]:
+    all_failed = all_failed_by(all_tests,
+                               key=lambda x: (x.class_ref, x.base_name))
     for base_test, group in itertools.groupby(
         failing_tests, key=lambda x: x.without_parameters(),
     ):
         items = list(group)
-        if items[0].is_parametrized and all(
-            x.failed for x in all_tests
-            if x.class_ref == base_test.class_ref
-            and x.base_name == base_test.base_name
-        ):
+        if items[0].is_parametrized and all_failed[
+            (base_test.class_ref, base_test.base_name)
+        ]:
             yield base_test
             continue
         yield from items
 
 
+def read_test_cases(path: str) -> set[TestCase]:
+    return set(iter_test_cases(path))
+
+
+def merge_results(results: typing.Iterable[typing.Iterable[TestCase]],
+                  op: typing.Callable[[bool, bool], bool] = operator.or_,
+                  missing: bool | None = None,
+                  ) -> set[TestCase]:
+    """
+    Merge test results from multiple runs, by test identity
+
+    By default, a test is considered failed if it failed in any run.
+    If missing is not None, it is used as the result for runs that
+    did not include the test.
+
+    >>> runs = [[TestCase("a", "x", "a.py", True),
+    ...          TestCase("a", "y", "a.py", True)],
+    ...         [TestCase("a", "x", "a.py", False),
+    ...          TestCase("a", "y", "a.py", True)]]
+    >>> [x.failed for x in sorted(merge_results(runs))]
+    [True, True]
+    >>> [x.failed for x in sorted(merge_results(runs, op=operator.and_))]
+    [False, True]
+
+    A test that was run only in one of the runs:
+
+    >>> runs[1].append(TestCase("a", "z", "a.py", True))
+    >>> [x.failed for x in sorted(merge_results(runs, op=operator.and_))]
+    [False, True, True]
+    >>> [x.failed for x in sorted(merge_results(runs, op=operator.and_,
+    ...                                         missing=False))]
+    [False, True, False]
+    """
+    statuses = {}
+    counts = collections.Counter()
+    num_runs = 0
+    for tests in results:
+        num_runs += 1
+        for x in tests:
+            k = (x.class_ref, x.name, x.path)
+            statuses[k] = (op(statuses[k], x.failed) if k in statuses
+                           else x.failed)
+            counts[k] += 1
+    if missing is not None:
+        for k, count in counts.items():
+            if count < num_runs:
+                statuses[k] = op(statuses[k], missing)
+    return {TestCase(*k, failed=v) for k, v in statuses.items()}
+
+
+def combine(failing_tests: list[TestCase],
+            all_tests: set[TestCase],
+            args: argparse.Namespace,
+            ) -> list[TestCase]:
+    if not args.no_combine_files:
+        failing_tests = list(combine_files(failing_tests, all_tests))
+    if not args.no_combine_classes:
+        failing_tests = list(combine_classes(failing_tests, all_tests))
+    if not args.no_combine_parameters:
+        failing_tests = list(combine_parameters(failing_tests, all_tests))
+    return failing_tests
+
+
 def main(prog_name: str, *argv: str) -> int:
     argp = argparse.ArgumentParser(prog=prog_name)
     argp.add_argument("xml",
-                      type=lambda x: lxml.etree.parse(x),
-                      metavar="file.xml",
-                      help="junit xml file to process")
+                      nargs="+",
+                      metavar="[impl=]file.xml",
+                      help="junit xml file(s) to process, optionally "
+                           "prefixed by the EPYTHON value they were "
+                           "produced with (e.g. python3.13=file.xml)")
+    argp.add_argument("-j", "--jobs",
+                      type=int,
+                      help="Number of files to parse in parallel "
+                           "(default: number of CPUs)")
     argp.add_argument("--no-combine-classes",
                       action="store_true",
                       help="Disable combining test classes if all tests fail")
@@ -149,26 +268,67 @@ def main(prog_name: str, *argv: str) -> int:
                       help="Disable combining parametrized tests if all fail")
     args = argp.parse_args(argv)
 
-    all_tests = {TestCase.from_xml(testcase)
-                 for testcase in args.xml.xpath("//testcase")}
-    failing_tests = sorted(filter(lambda x: x.failed, all_tests))
+    impls = []
+    paths = []
+    for arg in args.xml:
+        impl, sep, path = arg.partition("=")
+        # paths can contain "=" too, so the prefix is treated as impl
+        # only if it is a valid EPYTHON value
+        if not sep or not EPYTHON_RE.fullmatch(impl):
+            impl = None
+            path = arg
+        impls.append(impl)
+        paths.append(path)
+    if len(set(impls)) > 1 and None in impls:
+        argp.error("either all or none of the files must specify impl")
 
-    if len(all_tests) == len(failing_tests):
-        print("All tests failed!", file=sys.stderr)
-        return 1
+    if len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+            results = list(executor.map(read_test_cases, paths))
+    else:
+        results = [read_test_cases(paths[0])]
 
-    if not args.no_combine_files:
-        failing_tests = list(combine_files(failing_tests, all_tests))
-    if not args.no_combine_classes:
-        failing_tests = list(combine_classes(failing_tests, all_tests))
-    if not args.no_combine_parameters:
-        failing_tests = list(combine_parameters(failing_tests, all_tests))
+    # results from multiple files for the same implementation (e.g.
+    # for different architectures) are merged, and a test is considered
+    # failing if it failed in any of them
+    impl_results = collections.defaultdict(list)
+    for impl, tests in zip(impls, results):
+        impl_results[impl].append(tests)
+    impl_tests = {impl: merge_results(impl_results[impl])
+                  for impl in sorted(impl_results)}
+
+    for impl, tests in impl_tests.items():
+        if all(x.failed for x in tests):
+            if impl is not None:
+                print(f"All tests failed for {impl}!", file=sys.stderr)
+            else:
+                print("All tests failed!", file=sys.stderr)
+            return 1
+
+    # tests that failed for all implementations; a test that was not
+    # run for some implementation is not failing for it
+    all_tests = merge_results(impl_tests.values(), op=operator.and_,
+                              missing=False)
+    common_failing = sorted(filter(lambda x: x.failed, all_tests))
 
     print("EPYTEST_DESELECT=(")
-    for test in failing_tests:
+    for test in combine(common_failing, all_tests, args):
         print(f"\t{test.pytest_selector}")
     print(")")
 
+    if len(impl_tests) > 1:
+        common_set = frozenset(common_failing)
+        for impl, tests in impl_tests.items():
+            failing_tests = sorted(x for x in tests
+                                   if x.failed and x not in common_set)
+            if not failing_tests:
+                continue
+            print()
+            print(f"[[ ${{EPYTHON}} == {impl} ]] && EPYTEST_DESELECT+=(")
+            for test in combine(failing_tests, tests, args):
+                print(f"\t{test.pytest_selector}")
+            print(")")
+
     return 0
 
 
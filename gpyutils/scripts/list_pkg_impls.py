@@ -3,96 +3,264 @@
 # (c) 2013-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import argparse
+import json
 import sys
 
 from gentoopm import get_package_manager
 
-from gpyutils.implementations import get_python_impls, read_implementations
+from gpyutils.cache import JSONCache
+from gpyutils.implementations import (
+    get_python_impls,
+    implementations,
+    read_implementations,
+)
+from gpyutils.md5cache import read_md5_cache
+from gpyutils.metadata import MaintainerIndex, herd_email
+from gpyutils.output import record_writers
 from gpyutils.packages import PackageClass, get_package_class, group_packages
 
 
-def process(pkgs):
-    key = "slotted_atom"
-    for pg in group_packages(pkgs.sorted, key):
-        kw_impls = []
-        st_impls = []
-        eapi = None
-        ptype = None
-
-        for p in reversed(pg):
-            # if the newest version does not use python, stop here
-            impls = get_python_impls(p)
-            if impls is None:
-                break
-
-            # otherwise, try to find keywords of the newest version
-            # with stable and ~arch keyword
-            cl = get_package_class(p)
-            if eapi is None:
-                eapi = p.eapi
-            if not kw_impls:
-                if not cl == PackageClass.non_keyworded:
-                    kw_impls = [x.short_name for x in impls]
-            if not st_impls:
-                if cl == PackageClass.stable:
-                    st_impls = [x.short_name for x in impls]
-            if ptype is None:
-                if "distutils-r1" in p.inherits:
-                    with open(p.path) as f:
-                        for x in f:
-                            if x.startswith("DISTUTILS_USE_PEP517="):
-                                ptype = "(PEP517)"
-                                break
-                            if x.startswith("inherit "):
-                                ptype = "(legacy)"
-                                break
-                        else:
-                            ptype = "(legacy)"
-                else:
-                    ptype = "        "
-
-            if kw_impls and st_impls:
-                break
-
-        # if no impls found, the package is either non-python
-        # or unkeyworded
-        if not kw_impls and not st_impls:
-            continue
-
-        out = [f"{str(getattr(p, key)):<40}"]
-        out.append("EAPI:")
-        out.append(eapi)
-
-        assert ptype is not None
-        out.append(ptype)
-
-        if st_impls:
-            out.append(" STABLE:")
-            out.extend(st_impls)
-
-        # print only extra impls
-        for impl in list(kw_impls):
-            if impl in st_impls:
-                kw_impls.remove(impl)
-
-        if kw_impls:
-            out.append("  ~ARCH:")
-            out.extend(kw_impls)
-
-        print(" ".join(out))
-
-
-def main():
+def scan_ebuild_pep517(path):
+    """Check whether the ebuild sets DISTUTILS_USE_PEP517"""
+    with open(path) as f:
+        for x in f:
+            if x.startswith("DISTUTILS_USE_PEP517="):
+                return True
+            if x.startswith("inherit "):
+                return False
+    return False
+
+
+class PEP517Detector:
+    """
+    Detect whether distutils-r1 ebuilds use PEP517 mode
+
+    The md5-cache is used whenever possible -- PEP517 mode implies
+    a dependency on gpep517, except for DISTUTILS_USE_PEP517=no.
+    Otherwise, the ebuild is scanned and the result is stored in cache,
+    keyed by the ebuild checksum.  used holds the cache entries used
+    in this run.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.used = {}
+
+    def __call__(self, pkg):
+        md5_cache = read_md5_cache(pkg)
+        if md5_cache is None:
+            return scan_ebuild_pep517(pkg.path)
+        if "dev-python/gpep517" in md5_cache.get("BDEPEND", ""):
+            return True
+
+        ebuild_md5 = md5_cache["_md5_"]
+        ret = self.cache.get(ebuild_md5)
+        if ret is None:
+            ret = scan_ebuild_pep517(pkg.path)
+        self.used[ebuild_md5] = ret
+        return ret
+
+
+def get_slot_record(pg, uses_pep517):
+    """
+    Get the record for the slot group pg, or None if the package
+    is non-python or unkeyworded
+    """
+    kw_impls = []
+    st_impls = []
+    eapi = None
+    pep517 = None
+    ptype = None
+
+    for p in reversed(pg):
+        # if the newest version does not use python, stop here
+        impls = get_python_impls(p)
+        if impls is None:
+            break
+
+        # otherwise, try to find keywords of the newest version
+        # with stable and ~arch keyword
+        cl = get_package_class(p)
+        if eapi is None:
+            eapi = p.eapi
+        if not kw_impls:
+            if not cl == PackageClass.non_keyworded:
+                kw_impls = [x.short_name for x in impls]
+        if not st_impls:
+            if cl == PackageClass.stable:
+                st_impls = [x.short_name for x in impls]
+        if ptype is None:
+            ptype = "distutils-r1" in p.inherits
+            if ptype:
+                pep517 = uses_pep517(p)
+
+        if kw_impls and st_impls:
+            break
+
+    # if no impls found, the package is either non-python
+    # or unkeyworded
+    if not kw_impls and not st_impls:
+        return None
+
+    return {
+        "package": str(pg[0].slotted_atom),
+        "eapi": eapi,
+        "pep517": pep517,
+        "stable": st_impls,
+        "testing": kw_impls,
+    }
+
+
+def get_slot_fingerprint(pg):
+    """
+    Get a string identifying the state of all ebuilds in the slot group,
+    or None if md5-cache is not available
+    """
+    ret = []
+    for p in pg:
+        md5_cache = read_md5_cache(p)
+        if md5_cache is None:
+            return None
+        ret.extend((md5_cache["_md5_"], md5_cache.get("_eclasses_", "")))
+    ret.extend(x.r1_name for x in implementations)
+    return " ".join(ret)
+
+
+def iter_slot_records(pkgs, uses_pep517=None, cache=None, used=None):
+    """
+    Yield records for all python slots in pkgs
+
+    If cache is provided, records for slots whose ebuilds did not change
+    are taken from it, and used is updated with cache entries for all
+    processed slots.
+    """
+    if uses_pep517 is None:
+        uses_pep517 = PEP517Detector({})
+    if cache is None:
+        cache = {}
+    if used is None:
+        used = {}
+
+    for pg in group_packages(pkgs.sorted, "slotted_atom"):
+        key = str(pg[0].slotted_atom)
+        fingerprint = get_slot_fingerprint(pg)
+        cached = cache.get(key)
+        if fingerprint is not None and cached is not None and (
+                cached[0] == fingerprint):
+            record = cached[1]
+        else:
+            record = get_slot_record(pg, uses_pep517)
+        if fingerprint is not None:
+            used[key] = (fingerprint, record)
+
+        if record is not None:
+            yield record
+
+
+def format_record(record):
+    out = [f"{record['package']:<40}"]
+    out.append("EAPI:")
+    out.append(record["eapi"])
+
+    if record["pep517"] is None:
+        out.append("        ")
+    elif record["pep517"]:
+        out.append("(PEP517)")
+    else:
+        out.append("(legacy)")
+
+    st_impls = record["stable"]
+    if st_impls:
+        out.append(" STABLE:")
+        out.extend(st_impls)
+
+    # print only extra impls
+    kw_impls = [x for x in record["testing"] if x not in st_impls]
+    if kw_impls:
+        out.append("  ~ARCH:")
+        out.extend(kw_impls)
+
+    return " ".join(out)
+
+
+def load_baseline(path):
+    """Load records from a previous JSON lines output"""
+    with open(path) as f:
+        return {record["package"]: record
+                for record in (json.loads(x) for x in f if x.strip())}
+
+
+def main(prog_name, *argv):
+    argp = argparse.ArgumentParser(prog=prog_name)
+    argp.add_argument("-b", "--baseline",
+                      type=load_baseline,
+                      help="Output only slots that changed compared to "
+                           "the specified previous output (in jsonl "
+                           "format)")
+    argp.add_argument("-f", "--format",
+                      choices=["text", *record_writers],
+                      default="text",
+                      help="Output format (default: text)")
+    argp.add_argument("--herd",
+                      action="append",
+                      default=[],
+                      help="Include only packages maintained by specified "
+                           "project (formerly herd), e.g. python")
+    argp.add_argument("--maintainer",
+                      action="append",
+                      default=[],
+                      help="Include only packages maintained by specified "
+                           "person/project (by e-mail)")
+    argp.add_argument("--no-cache",
+                      action="store_true",
+                      help="Do not use cached results, and do not update "
+                           "the cache")
+    argp.add_argument("-r", "--repo",
+                      default="gentoo",
+                      help="Work on given repository (default: gentoo)")
+    args = argp.parse_args(list(argv))
+
     pm = get_package_manager()
     read_implementations(pm)
 
-    process(pm.repositories["gentoo"])
+    cache = JSONCache(None if args.no_cache else f"list-pkg-impls-{args.repo}",
+                      version=2)
+    uses_pep517 = PEP517Detector(cache.get("pep517", {}))
+    used_slots = {}
+    pkgs = pm.repositories[args.repo]
+    maint_filter = [*args.maintainer, *map(herd_email, args.herd)]
+    if maint_filter:
+        pkgs = MaintainerIndex(pkgs.path).filter(pkgs, maint_filter)
+    records = iter_slot_records(pkgs, uses_pep517,
+                                cache.get("slots", {}), used_slots)
+    if args.baseline is not None:
+        records = (x for x in records if args.baseline.get(x["package"]) != x)
+
+    if args.format == "text":
+        for record in records:
+            print(format_record(record))
+    else:
+        with record_writers[args.format](sys.stdout) as writer:
+            for record in records:
+                writer.write(record)
+
+    if maint_filter:
+        # keep entries for packages that were filtered out
+        cache.setdefault("pep517", {}).update(uses_pep517.used)
+        cache.setdefault("slots", {}).update(used_slots)
+    else:
+        # replace the cache to drop entries for removed ebuilds
+        cache.clear()
+        cache["pep517"] = uses_pep517.used
+        cache["slots"] = used_slots
+    cache.save()
     return 0
 
 
 def entry_point():
-    sys.exit(main())
+    sys.exit(main(*sys.argv))
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    sys.exit(main(*sys.argv))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import argparse
+import sys
+
+from gentoopm import get_package_manager
+
+from gpyutils.implementations import read_implementations
+from gpyutils.packages import find_all_redundant
+
+
+def main(prog_name, *argv):
+    argp = argparse.ArgumentParser(prog=prog_name)
+    argp.add_argument("-r", "--repo",
+                      default="gentoo",
+                      help="Work on given repository (default: gentoo)")
+    argp.add_argument("package",
+                      nargs="*",
+                      help="Packages to process (default: all packages "
+                           "in the repository)")
+    args = argp.parse_args(list(argv))
+
+    pm = get_package_manager()
+    read_implementations(pm)
+
+    repo = pm.repositories[args.repo]
+    if args.package:
+        pkg_sets = [repo.filter(pkg) for pkg in args.package]
+    else:
+        pkg_sets = [repo]
+
+    for pkgs in pkg_sets:
+        for p in find_all_redundant(pkgs):
+            print(p)
+
+    return 0
+
+
+def entry_point():
+    sys.exit(main(*sys.argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
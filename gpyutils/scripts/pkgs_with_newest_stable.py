@@ -3,32 +3,52 @@
 # (c) 2013-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import argparse
 import sys
 
 from gentoopm import get_package_manager
 
-from gpyutils.packages import group_packages
+from gpyutils.metadata import MaintainerIndex, herd_email
+from gpyutils.packages import PackageClass, get_newest_keyworded
 
 
-def process(pkgs):
-    for pg in group_packages(pkgs.sorted, "unversioned_atom"):
-        for p in reversed(pg):
-            positive_keywords = frozenset(x for x in p.keywords
-                                          if not x.startswith("-"))
-            # skip unkeyworded (live)
-            if not positive_keywords:
-                continue
-            # if the newest version has at least one stable keywords,
-            # print it
-            if any(not x.startswith("~") for x in positive_keywords):
-                print(p.unversioned_atom)
-            break
+def process(pkgs, arches=None):
+    index = get_newest_keyworded(pkgs, arches)
+    for key in sorted(index):
+        p, cls = index[key]
+        # if the newest keyworded version has at least one stable
+        # keyword, print it
+        if cls == PackageClass.stable:
+            print(p.unversioned_atom)
 
 
 def main(prog_name, *argv):
+    argp = argparse.ArgumentParser(prog=prog_name)
+    argp.add_argument("-a", "--arch",
+                      action="append",
+                      help="Consider only keywords for specified arch(es)")
+    argp.add_argument("--herd",
+                      action="append",
+                      default=[],
+                      help="Include only packages maintained by specified "
+                           "project (formerly herd), e.g. python")
+    argp.add_argument("--maintainer",
+                      action="append",
+                      default=[],
+                      help="Include only packages maintained by specified "
+                           "person/project (by e-mail)")
+    argp.add_argument("-r", "--repo",
+                      default="gentoo",
+                      help="Work on given repository (default: gentoo)")
+    args = argp.parse_args(list(argv))
+
     pm = get_package_manager()
+    pkgs = pm.repositories[args.repo]
+    maint_filter = [*args.maintainer, *map(herd_email, args.herd)]
+    if maint_filter:
+        pkgs = MaintainerIndex(pkgs.path).filter(pkgs, maint_filter)
 
-    process(pm.repositories["gentoo"])
+    process(pkgs, args.arch)
 
     return 0
 
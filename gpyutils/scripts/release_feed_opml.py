@@ -4,14 +4,16 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import argparse
+import itertools
 import locale
-import os
 import sys
 import typing
 from pathlib import Path
 
 import lxml.etree
 
+from gpyutils.metadata import harvest_metadata_xml
+
 
 class FeedMetadata(typing.NamedTuple):
     feed_type: str
@@ -50,15 +52,83 @@ def remote_id_list(val: str) -> list:
     return list(inner())
 
 
+# all remote-ids are fetched at once and grouped by type afterwards
+REMOTE_ID_XPATH = lxml.etree.XPath("//upstream/remote-id")
+
+
+def get_remote_ids(path: str) -> dict[str, list[str]]:
+    """Get remote-ids from metadata.xml, grouped by type"""
+    ret = {}
+    xml = lxml.etree.parse(path)
+    for r in REMOTE_ID_XPATH(xml):
+        ret.setdefault(r.get("type"), []).append(r.text)
+    return ret
+
+
+def load_opml_feeds(path: str) -> dict[tuple[str, str], str]:
+    """Load feeds from OPML file, as (type, xmlUrl) -> text mapping"""
+    xml = lxml.etree.parse(path)
+    return {(x.get("type"), x.get("xmlUrl")): x.get("text", "")
+            for x in xml.iter("outline")
+            if x.get("xmlUrl") is not None}
+
+
+def write_opml(out: typing.BinaryIO,
+               folders: typing.Iterable[
+                   tuple[str, typing.Iterable[FeedMetadata]]],
+               ) -> None:
+    """Write OPML incrementally, as feeds are yielded"""
+    out.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+    with (lxml.etree.xmlfile(out, encoding="UTF-8") as xf,
+          xf.element("opml", version="1.0")):
+        xf.write("\n  ",
+                 lxml.etree.Comment(
+                     " generated using gpy-release-feed-opml "),
+                 "\n  ")
+        with xf.element("head"):
+            xf.write("\n    ")
+            with xf.element("title"):
+                xf.write("Python Release Feeds")
+            xf.write("\n  ")
+        xf.write("\n  ")
+        with xf.element("body"):
+            for title, feeds in folders:
+                xf.write("\n    ")
+                with xf.element("outline", title=title, type="folder"):
+                    for metadata in feeds:
+                        xf.write("\n      ",
+                                 lxml.etree.Element(
+                                     "outline",
+                                     text=metadata.text,
+                                     type=metadata.feed_type,
+                                     xmlUrl=metadata.url,
+                                     htmlUrl=metadata.html_url))
+                    xf.write("\n    ")
+            xf.write("\n  ")
+        xf.write("\n")
+    out.write(b"\n")
+
+
 def main(prog_name: str, *argv: str) -> int:
     locale.setlocale(locale.LC_ALL, "")
     default_types = ["pypi", "github"]
 
     argp = argparse.ArgumentParser(prog=prog_name)
     argp.add_argument("--diff",
-                      type=lambda x: lxml.etree.parse(x),
+                      type=load_opml_feeds,
                       help="Diff against existing OPML and output only "
                            "new feeds")
+    argp.add_argument("-j", "--jobs",
+                      type=int,
+                      help="Number of metadata.xml files to parse "
+                           "in parallel (default: number of CPUs)")
+    argp.add_argument("--group-by-category",
+                      action="store_true",
+                      help="Group feeds into per-category folders")
+    argp.add_argument("--no-cache",
+                      action="store_true",
+                      help="Do not use cached remote-ids, and do not "
+                           "update the cache")
     argp.add_argument("--sort-key",
                       choices=FeedMetadata._fields,
                       default="text",
@@ -68,65 +138,58 @@ def main(prog_name: str, *argv: str) -> int:
                       default=default_types,
                       help="Remote-id type precedence, comma-separated "
                            f"(default: {','.join(default_types)})")
+    argp.add_argument("--report-removed",
+                      action="store_true",
+                      help="With --diff, also list feeds from the existing "
+                           "OPML that are no longer generated, e.g. because "
+                           "the package was removed (on stderr)")
     argp.add_argument("path",
                       nargs="+",
                       type=Path,
                       help="Paths to process (recursively)")
     args = argp.parse_args(list(argv))
 
-    feeds_set = set()
-    for path in args.path:
-        for dirpath, dirnames, filenames in os.walk(path):
-            if "metadata.xml" not in filenames:
-                continue
-
-            xml = lxml.etree.parse(Path(dirpath) / "metadata.xml")
-            for try_type in args.type_precedence:
-                remotes = xml.xpath(
-                    f"//upstream/remote-id[@type={try_type!r}]")
-                if remotes:
-                    for r in remotes:
-                        feeds_set.add(getattr(Getters, try_type)(r.text))
-                    break
-
-    feeds = sorted(feeds_set,
-                     key=lambda x: locale.strxfrm(getattr(x, args.sort_key)))
+    remote_ids = harvest_metadata_xml(
+        args.path, get_remote_ids,
+        cache_name=None if args.no_cache else "release-feed-opml",
+        jobs=args.jobs)
+
+    # feed -> category (the first one, if multiple packages use it)
+    feed_categories = {}
+    for key, ids in remote_ids.items():
+        category = Path(key).parent.parent.name
+        for try_type in args.type_precedence:
+            remotes = ids.get(try_type)
+            if remotes:
+                for r in remotes:
+                    feed = getattr(Getters, try_type)(r)
+                    feed_categories[feed] = min(
+                        category, feed_categories.get(feed, category))
+                break
+
+    feeds = sorted(feed_categories,
+                   key=lambda x: locale.strxfrm(getattr(x, args.sort_key)))
 
     if args.diff is not None:
-        feeds = filter(
-            lambda x: not args.diff.xpath(f"//outline[@type={x.feed_type!r} "
-                                          f"and @xmlUrl={x.url!r}]"),
-            feeds)
-
-    outxml = lxml.etree.ElementTree(lxml.etree.XML("""\
-<?xml version="1.0"?>
-<opml version="1.0">
-  <!-- generated using gpy-release-feed-opml -->
-  <head>
-    <title>Python Release Feeds</title>
-  </head>
-  <body>
-    <outline title="python" type="folder">
-      </outline>
-  </body>
-</opml>
-"""))
-    folder = outxml.find("//outline")
-    for metadata in feeds:
-        feed = lxml.etree.Element(
-            "outline",
-            text=metadata.text,
-            type=metadata.feed_type,
-            xmlUrl=metadata.url,
-            htmlUrl=metadata.html_url)
-        feed.tail = "\n      "
-        folder.append(feed)
-
-    feed.tail = "\n    "
-    sys.stdout.buffer.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
-    outxml.write(sys.stdout.buffer, encoding="UTF-8")
-    sys.stdout.buffer.write(b"\n")
-
+        if args.report_removed:
+            current = frozenset((x.feed_type, x.url) for x in feeds)
+            for key, text in sorted(args.diff.items(),
+                                    key=lambda x: locale.strxfrm(x[1])):
+                if key not in current:
+                    print(f"Removed feed: {text} ({key[1]})",
+                          file=sys.stderr)
+
+        feeds = [x for x in feeds
+                 if (x.feed_type, x.url) not in args.diff]
+
+    if args.group_by_category:
+        # sort is stable, so feeds remain sorted within categories
+        feeds.sort(key=lambda x: feed_categories[x])
+        folders = itertools.groupby(feeds, key=lambda x: feed_categories[x])
+    else:
+        folders = [("python", feeds)]
+
+    write_opml(sys.stdout.buffer, folders)
     return 0
 
 
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import typing
+
+import requests
+import requests.adapters
+import urllib3.util
+from gentoopm import get_package_manager
+
+from gpyutils.ansi import ANSI
+from gpyutils.metadata import MaintainerIndex
+
+DEFAULT_URL = "https://bugs.gentoo.org"
+MAINTAINER_NEEDED = "maintainer-needed@gentoo.org"
+
+
+def read_pkgcheck_stream(stream: typing.Iterable[str],
+                         keywords: frozenset[str] | None = None,
+                         ) -> list[str]:
+    """
+    Get the list of packages reported in pkgcheck JsonStream output,
+    in order of appearance, optionally limited to specified result
+    classes.
+
+    >>> read_pkgcheck_stream([
+    ...     '{"__class__": "PythonCompatUpdate", "category": "dev-python",'
+    ...     ' "package": "foo", "version": "1"}',
+    ...     '{"__class__": "PythonCompatUpdate", "category": "dev-python",'
+    ...     ' "package": "foo", "version": "2"}',
+    ...     '{"__class__": "UnusedInherits", "category": "dev-python",'
+    ...     ' "package": "bar", "version": "1"}',
+    ...     '{"__class__": "UnknownCategoryDirs", "path": "foo"}',
+    ... ], frozenset(["PythonCompatUpdate"]))
+    ['dev-python/foo']
+    """
+    pkgs = {}
+    for line in stream:
+        if not line.strip():
+            continue
+        report = json.loads(line)
+        if keywords is not None and report["__class__"] not in keywords:
+            continue
+        if "package" not in report:
+            continue
+        pkgs[f"{report['category']}/{report['package']}"] = None
+    return list(pkgs)
+
+
+def make_session(api_key: str | None, jobs: int, retries: int,
+                 ) -> requests.Session:
+    """Make a HTTP session with a connection pool and retries"""
+    # retry only on connection errors, as the bug may have been filed
+    # already if the request was sent, even if the response is an error
+    # (e.g. a gateway timeout)
+    retry = urllib3.util.Retry(total=retries,
+                               read=0,
+                               status=0,
+                               other=0,
+                               backoff_factor=1)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=jobs,
+                                            max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if api_key is not None:
+        session.headers["X-BUGZILLA-API-KEY"] = api_key
+    return session
+
+
+def get_error_message(resp: requests.Response) -> str | None:
+    """Get the error message from Bugzilla JSON response, if any"""
+    try:
+        return resp.json()["message"]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def file_bug(session: requests.Session, url: str, bug: dict) -> int:
+    """File a bug via Bugzilla REST API, return its number"""
+    resp = session.post(f"{url}/rest/bug", json=bug, timeout=60)
+    try:
+        resp.raise_for_status()
+    except requests.HTTPError as e:
+        # Bugzilla reports errors as JSON, include the message if present
+        message = get_error_message(resp)
+        if message is None:
+            raise
+        raise RuntimeError(f"{e}: {message}") from e
+    data = resp.json()
+    if data.get("error"):
+        raise RuntimeError(data.get("message", "unknown error"))
+    return data["id"]
+
+
+def main(prog_name: str, *argv: str) -> int:
+    argp = argparse.ArgumentParser(prog=prog_name)
+    argp.add_argument("--api-key",
+                      default=os.environ.get("BUGZILLA_API_KEY"),
+                      help="Bugzilla API key (default: BUGZILLA_API_KEY "
+                           "environment variable)")
+    argp.add_argument("-b", "--blocks",
+                      type=int,
+                      action="append",
+                      default=[],
+                      help="Make filed bugs block the specified bug "
+                           "(e.g. tracker)")
+    argp.add_argument("-d", "--description",
+                      required=True,
+                      help="Bug description")
+    argp.add_argument("-j", "--jobs",
+                      type=int,
+                      default=4,
+                      help="Maximum number of bugs to file in parallel "
+                           "(default: 4)")
+    argp.add_argument("-k", "--keywords",
+                      type=lambda x: frozenset(x.split(",")),
+                      help="Include only specified pkgcheck result classes "
+                           "(comma-separated)")
+    argp.add_argument("-n", "--dry-run",
+                      action="store_true",
+                      help="Print bugs that would be filed instead of "
+                           "filing them")
+    argp.add_argument("-r", "--repo",
+                      default="gentoo",
+                      help="Repository to get maintainers from "
+                           "(default: gentoo)")
+    argp.add_argument("--retries",
+                      type=int,
+                      default=3,
+                      help="Number of retries on connection errors "
+                           "(default: 3)")
+    argp.add_argument("-s", "--summary",
+                      required=True,
+                      help="Bug summary (prefixed by '<package>: ')")
+    argp.add_argument("--url",
+                      default=DEFAULT_URL,
+                      help=f"Bugzilla URL (default: {DEFAULT_URL}), "
+                           "e.g. a local test instance")
+    argp.add_argument("input",
+                      nargs="?",
+                      type=argparse.FileType(),
+                      default=sys.stdin,
+                      help="pkgcheck JsonStream output (default: stdin)")
+    args = argp.parse_args(list(argv))
+
+    with args.input:
+        pkgs = read_pkgcheck_stream(args.input, args.keywords)
+
+    pm = get_package_manager()
+    maintainers = MaintainerIndex(pm.repositories[args.repo].path)
+
+    bugs = {}
+    for pkg in pkgs:
+        assignee, *cc = (maintainers.maintainers(pkg)
+                         or [MAINTAINER_NEEDED])
+        bugs[pkg] = {
+            "product": "Gentoo Linux",
+            "component": "Current packages",
+            "version": "unspecified",
+            "op_sys": "All",
+            "platform": "All",
+            "summary": f"{pkg}: {args.summary}",
+            "description": args.description,
+            "assigned_to": assignee,
+            "cc": cc,
+            "blocks": args.blocks,
+        }
+
+    if args.dry_run:
+        for pkg, bug in bugs.items():
+            print(f"{ANSI.white}{pkg}{ANSI.reset}: {bug['assigned_to']}"
+                  + (f" (CC: {', '.join(bug['cc'])})" if bug["cc"] else ""))
+        return 0
+
+    url = args.url.rstrip("/")
+    failed = False
+    with (make_session(args.api_key, args.jobs, args.retries) as session,
+          concurrent.futures.ThreadPoolExecutor(args.jobs) as executor):
+        futures = [executor.submit(file_bug, session, url, bug)
+                   for bug in bugs.values()]
+        # print in input order
+        for pkg, future in zip(bugs, futures):
+            try:
+                print(f"{pkg}: bug {future.result()}")
+            except (requests.RequestException, RuntimeError,
+                    ValueError) as e:
+                sys.stderr.write(f"{ANSI.red}{pkg}: failed to file bug: "
+                                 f"{e}{ANSI.reset}\n")
+                failed = True
+
+    return 1 if failed else 0
+
+
+def entry_point() -> None:
+    sys.exit(main(*sys.argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv))
@@ -3,6 +3,7 @@
 # (c) 2013-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import argparse
 import sys
 
 from gentoopm import get_package_manager
@@ -15,6 +16,7 @@ from gpyutils.implementations import (
     implementations,
     read_implementations,
 )
+from gpyutils.output import record_writers
 from gpyutils.packages import (
     PackageClass,
     find_redundant,
@@ -92,16 +94,77 @@ def process(pkgs):
                 " ".join(output).rstrip()))
 
 
+def export(pkgs, writer):
+    """Write one record per ebuild using writer"""
+    for pg in group_packages(pkgs.sorted, "slotted_atom"):
+        redundant = set(find_redundant(pg))
+
+        for p in pg:
+            try:
+                masked = p.repo_masked
+            except NotImplementedError:
+                masked = None
+
+            ptype = guess_package_type(p)
+            impl_bitmap = 0
+            if ptype is not None:
+                impls = get_python_impls(p)
+                for bit, i in enumerate(implementations):
+                    if i in impls:
+                        impl_bitmap |= 1 << bit
+
+            writer.write({
+                "package": str(p.key),
+                "slot": p.slot,
+                "version": str(p.version),
+                "keywords": get_package_class(p).name,
+                "masked": masked,
+                "type": ptype.value if ptype is not None else None,
+                "redundant": p in redundant,
+                "impls": impl_bitmap,
+            })
+
+
 def main(prog_name, *argv):
+    argp = argparse.ArgumentParser(prog=prog_name)
+    argp.add_argument("-a", "--all",
+                      action="store_true",
+                      help="Process all packages in the repository")
+    argp.add_argument("-f", "--format",
+                      choices=["text", *record_writers],
+                      default="text",
+                      help="Output format (default: text).  In other "
+                           "formats, one record is output per ebuild, and "
+                           "supported implementations are output as "
+                           "a bitmap, with bit N corresponding to N-th "
+                           "implementation in implementations.txt")
+    argp.add_argument("-r", "--repo",
+                      default="gentoo",
+                      help="Work on given repository (default: gentoo)")
+    argp.add_argument("package",
+                      nargs="*",
+                      help="Packages to process")
+    args = argp.parse_args(list(argv))
+
+    if not args.package and not args.all:
+        argp.error("either packages or --all need to be specified")
+
     pm = get_package_manager()
     read_implementations(pm)
 
-    if not argv:
-        sys.stderr.write("Usage: %s <atom>...\n" % prog_name)
-        return 1
-
-    for pkg in argv:
-        process(pm.repositories["gentoo"].filter(pkg))
+    repo = pm.repositories[args.repo]
+    if args.all:
+        pkg_sets = [repo]
+    else:
+        pkg_sets = [repo.filter(pkg) for pkg in args.package]
+
+    if args.format == "text":
+        for pkgs in pkg_sets:
+            process(pkgs)
+    else:
+        with record_writers[args.format](sys.stdout) as writer:
+            for pkgs in pkg_sets:
+                export(pkgs, writer)
 
     return 0
 
@@ -4,10 +4,18 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import argparse
+import collections
+import concurrent.futures
+import difflib
 import json
+import os
+import queue
 import re
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import typing
 from pathlib import Path
 
@@ -23,93 +31,186 @@ MIRROR_PYPI_RE = re.compile(
 S_LINE_RE = re.compile(r"\n\s*S=.*")
 
 
-def process_json_stream(stream: typing.IO[bytes]) -> None:
-    for line in stream:
-        report = json.loads(line)
-        if report["__class__"] != "PythonInlinePyPIURI":
-            continue
-        pkg = f"{report['category']}/{report['package']}"
-        if report["replacement"] is not None:
-            print(f"Skipping {pkg}, custom SRC_URI required",
-                  file=sys.stderr)
-            continue
-
-        path = Path(f"{pkg}/{report['package']}-{report['version']}.ebuild")
-        for ebuild in Path(pkg).glob("*9999*.ebuild"):
-            print(f"Live ebuild may need updating: {ebuild}",
-                  file=sys.stderr)
-
-        metavars = []
-        if not report["normalize"]:
-            metavars.append("\nPYPI_NO_NORMALIZE=1")
-        pypi_pn = report["pypi_pn"]
-        if pypi_pn is not None:
-            # visual suggestions how the other way from how we like it
-            pypi_pn = (pypi_pn.replace('"', "") if '"' in pypi_pn
-                       else f'"{pypi_pn}"')
-            metavars.append(f"\nPYPI_PN={pypi_pn}")
-
-        with open(path) as f:
-            ebuild = f.read()
-
-        # insert metavars below ^DISTUTILS_USE, or ^PYTHON_COMPAT=
-        if metavars:
-            inserted = []
-
-            def repl(match: re.Match) -> str:
-                inserted.append(True)
-                return match.group(0) + "".join(metavars)
-
-            ebuild = METAVAR_INSERT_RE.sub(repl, ebuild, count=1)
-            if not inserted:
-                ebuild = METAVAR_INSERT2_RE.sub(repl, ebuild, count=1)
-            assert inserted, ebuild
-
-        # add pypi.eclass to inherits
-        inserted = []
-
-        def repl(match: re.Match) -> str:
-            inserted.append(True)
-            return match.group(0) + " pypi"
-
-        ebuild = INHERIT_RE.sub(repl, ebuild, count=1)
-        assert inserted, ebuild
-
-        if report["append"]:
-            # change SRC_URI= to SRC_URI+=
-            inserted = []
-
-            def repl(match: re.Match) -> str:
-                inserted.append(True)
-                return match.group(0).replace("=", "+=")
-
-            ebuild = SRC_URI_RE.sub(repl, ebuild, count=1)
-            assert inserted, ebuild
-
-            # remove mirror://pypi
-            inserted = []
-
-            def repl(match: re.Match) -> str:
-                inserted.append(True)
-                return ""
-
-            ebuild = MIRROR_PYPI_RE.sub(repl, ebuild, count=1)
-            assert inserted, ebuild
-        else:
-            # remove SRC_URI entirely
-            inserted = []
+def convert_ebuild(ebuild: str, report: dict) -> str:
+    """Convert ebuild contents to use pypi.eclass, per pkgcheck report"""
+    metavars = []
+    if not report["normalize"]:
+        metavars.append("\nPYPI_NO_NORMALIZE=1")
+    pypi_pn = report["pypi_pn"]
+    if pypi_pn is not None:
+        # visual suggestions how the other way from how we like it
+        pypi_pn = (pypi_pn.replace('"', "") if '"' in pypi_pn
+                   else f'"{pypi_pn}"')
+        metavars.append(f"\nPYPI_PN={pypi_pn}")
+
+    # insert metavars below ^DISTUTILS_USE, or ^PYTHON_COMPAT=
+    if metavars:
+        metavars = "".join(metavars)
+        ebuild, count = METAVAR_INSERT_RE.subn(
+            lambda m: m.group(0) + metavars, ebuild, count=1)
+        if not count:
+            ebuild, count = METAVAR_INSERT2_RE.subn(
+                lambda m: m.group(0) + metavars, ebuild, count=1)
+        assert count, ebuild
+
+    # add pypi.eclass to inherits
+    ebuild, count = INHERIT_RE.subn(
+        lambda m: m.group(0) + " pypi", ebuild, count=1)
+    assert count, ebuild
+
+    if report["append"]:
+        # change SRC_URI= to SRC_URI+=
+        ebuild, count = SRC_URI_RE.subn(
+            lambda m: m.group(0).replace("=", "+="), ebuild, count=1)
+        assert count, ebuild
+
+        # remove mirror://pypi
+        ebuild, count = MIRROR_PYPI_RE.subn("", ebuild, count=1)
+        assert count, ebuild
+    else:
+        # remove SRC_URI entirely
+        ebuild, count = SRC_URI_LINE_RE.subn("", ebuild, count=1)
+        assert count, ebuild
+
+    return S_LINE_RE.sub("", ebuild, count=1)
+
+
+def write_ebuild(path: Path, data: str) -> None:
+    """Atomically replace ebuild contents"""
+    with tempfile.NamedTemporaryFile(
+            "w", dir=path.parent, delete=False) as f:
+        tmp_path = f.name
+        f.write(data)
+
+    shutil.copymode(path, tmp_path)
+    os.rename(tmp_path, path)
+
+
+def update_ebuild(path: Path, report: dict, dry_run: bool = False,
+                  ) -> str | None:
+    """Update ebuild, or return the unified diff if dry_run is True"""
+    with open(path) as f:
+        ebuild = f.read()
+    new_ebuild = convert_ebuild(ebuild, report)
+    if dry_run:
+        return "".join(difflib.unified_diff(
+            ebuild.splitlines(keepends=True),
+            new_ebuild.splitlines(keepends=True),
+            fromfile=f"a/{path}",
+            tofile=f"b/{path}"))
+    write_ebuild(path, new_ebuild)
+    return None
+
+
+def process_json_stream(stream: typing.Iterable[bytes],
+                        jobs: int | None = None,
+                        dry_run: bool = False,
+                        ) -> bool:
+    """
+    Process pkgcheck reports and update ebuilds accordingly
+
+    The ebuilds are updated in a process pool, while the reports
+    are still being read.  If dry_run is True, the ebuilds are not
+    modified and a unified diff is printed instead.  Returns True
+    if all ebuilds were processed successfully.
+    """
+    ok = True
+    seen = set()
+    pending = collections.deque()
+
+    def finish(block: bool) -> None:
+        nonlocal ok
+        # handle results in order, so that diffs are output
+        # deterministically
+        while pending and (block or pending[0][1].done()):
+            path, future = pending.popleft()
+            try:
+                diff = future.result()
+            # convert_ebuild() asserts on unexpected ebuild contents
+            except (AssertionError, KeyError, OSError, ValueError) as e:
+                print(f"Updating {path} failed: {e!r}", file=sys.stderr)
+                ok = False
+                continue
+            if diff is not None:
+                sys.stdout.write(diff)
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        for line in stream:
+            report = json.loads(line)
+            if report["__class__"] != "PythonInlinePyPIURI":
+                continue
+            pkg = f"{report['category']}/{report['package']}"
+            if report["replacement"] is not None:
+                print(f"Skipping {pkg}, custom SRC_URI required",
+                      file=sys.stderr)
+                continue
 
-            def repl(match: re.Match) -> str:
-                inserted.append(True)
-                return ""
+            path = Path(
+                f"{pkg}/{report['package']}-{report['version']}.ebuild")
+            # every ebuild is updated once, even if reported repeatedly
+            if path in seen:
+                continue
+            seen.add(path)
+            for ebuild in Path(pkg).glob("*9999*.ebuild"):
+                print(f"Live ebuild may need updating: {ebuild}",
+                      file=sys.stderr)
 
-            ebuild = SRC_URI_LINE_RE.sub(repl, ebuild, count=1)
-            assert inserted, ebuild
+            pending.append(
+                (path, executor.submit(update_ebuild, path, report,
+                                       dry_run=dry_run)))
+            finish(block=False)
 
-        ebuild = S_LINE_RE.sub("", ebuild, count=1)
+        finish(block=True)
 
-        with open(path, "w") as f:
-            f.write(ebuild)
+    return ok
+
+
+def get_categories() -> list[str]:
+    """Get the category list of the repository in current directory"""
+    with open("profiles/categories") as f:
+        return [x.strip() for x in f if x.strip()]
+
+
+def get_changed_packages(ref: str) -> list[str]:
+    """Get packages changed since git ref in current directory"""
+    categories = frozenset(get_categories())
+    changed = subprocess.run(["git", "diff", "--name-only", ref, "--"],
+                             stdout=subprocess.PIPE,
+                             check=True,
+                             text=True).stdout
+    packages = set()
+    for path in changed.splitlines():
+        spl = path.split("/")
+        if len(spl) >= 3 and spl[0] in categories:
+            packages.add(f"{spl[0]}/{spl[1]}")
+    return sorted(packages)
+
+
+def multiplex_streams(streams: list[typing.IO[bytes]],
+                      ) -> typing.Generator[bytes, None, None]:
+    """Yield lines from multiple streams, as they become available"""
+    if len(streams) == 1:
+        yield from streams[0]
+        return
+
+    lines = queue.SimpleQueue()
+
+    def reader(stream: typing.IO[bytes]) -> None:
+        for line in stream:
+            lines.put(line)
+        # EOF marker
+        lines.put(None)
+
+    for stream in streams:
+        threading.Thread(target=reader, args=(stream,), daemon=True).start()
+
+    remaining = len(streams)
+    while remaining > 0:
+        line = lines.get()
+        if line is None:
+            remaining -= 1
+        else:
+            yield line
 
 
 def main(prog_name: str, *argv: str) -> int:
@@ -118,13 +219,36 @@ def main(prog_name: str, *argv: str) -> int:
                       action="store_true",
                       help="Update all package versions rather than "
                            "the latest (i.e. omit -f latest to pkgcheck)")
+    argp.add_argument("-n", "--dry-run",
+                      action="store_true",
+                      help="Do not modify ebuilds, output a unified diff "
+                           "of the changes instead")
+    argp.add_argument("-j", "--jobs",
+                      type=int,
+                      help="Number of ebuilds to update in parallel "
+                           "(default: number of CPUs)")
+    argp.add_argument("-c", "--changed-since",
+                      metavar="REF",
+                      help="Scan only packages changed since given git ref "
+                           "(when running pkgcheck)")
+    argp.add_argument("-s", "--shards",
+                      type=int,
+                      default=1,
+                      help="Number of concurrent pkgcheck processes "
+                           "to shard the scan across, by category or by "
+                           "changed package (default: 1)")
     argp.add_argument("data",
                       nargs="?",
                       type=argparse.FileType("rb"),
                       help="Input data (in pkgcheck JsonStream format), "
                            "the default is to run pkgcheck directly")
     args = argp.parse_args(list(argv))
+    if args.data is not None and (args.changed_since is not None
+                                  or args.shards != 1):
+        argp.error("--changed-since and --shards can not be used "
+                   "with input data file")
 
+    subps = []
     if args.data is None:
         pkgcheck_args = [
             "pkgcheck", "scan",
@@ -134,11 +258,35 @@ def main(prog_name: str, *argv: str) -> int:
         ]
         if not args.all_versions:
             pkgcheck_args += ["-f", "latest"]
-        subp = subprocess.Popen(pkgcheck_args, stdout=subprocess.PIPE)
-        args.data = subp.stdout
-    process_json_stream(args.data)
 
-    return 0
+        if args.changed_since is not None:
+            targets = get_changed_packages(args.changed_since)
+            if not targets:
+                print(f"No packages changed since {args.changed_since}",
+                      file=sys.stderr)
+                return 0
+        elif args.shards > 1:
+            targets = [f"{x}/*" for x in get_categories()]
+        else:
+            targets = []
+
+        shards = [x for x in (targets[i::args.shards]
+                              for i in range(args.shards)) if x]
+        subps = [subprocess.Popen(pkgcheck_args + shard,
+                                  stdout=subprocess.PIPE)
+                 for shard in shards or [[]]]
+        args.data = multiplex_streams([x.stdout for x in subps])
+    ret = 0
+    if not process_json_stream(args.data, jobs=args.jobs,
+                               dry_run=args.dry_run):
+        ret = 1
+    for subp in subps:
+        if subp.wait() != 0:
+            print(f"pkgcheck failed with exit status {subp.returncode}, "
+                  "results may be incomplete", file=sys.stderr)
+            ret = 1
+
+    return ret
 
 
 def entry_point() -> None:
@@ -4,13 +4,15 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import argparse
+import collections
+import contextlib
 import functools
+import itertools
 import os.path
 import re
 import sys
 
 from gentoopm import get_package_manager
-from gentoopm.basepm.atom import PMAtom
 
 from gpyutils.ansi import ANSI
 from gpyutils.implementations import (
@@ -18,8 +20,14 @@ from gpyutils.implementations import (
     get_python_impls,
     read_implementations,
 )
-from gpyutils.packages import PackageClass, get_package_class, group_packages
-from gpyutils.pycompat import EbuildMangler
+from gpyutils.metadata import MaintainerIndex, herd_email
+from gpyutils.packages import (
+    PackageClass,
+    get_package_class,
+    group_packages,
+    iter_dep_atoms,
+)
+from gpyutils.transaction import EbuildTransaction
 
 
 def obfuscate_email(email):
@@ -28,20 +36,43 @@ def obfuscate_email(email):
     return email.replace("@", "[at]")
 
 
-def print_package(p, pkg_print, maintainers=False):
+def print_package(p, pkg_print, maintainers=None):
     # in case stdout & stderr goes to the same console,
     # clean up the line before printing
     sys.stderr.write("%s\r" % ANSI.clear_line)
     out = str(pkg_print(p))
-    if maintainers:
+    if maintainers is not None:
         out += " ["
-        out += " ".join(obfuscate_email(m.email) for m in p.maintainers)
+        out += " ".join(obfuscate_email(m)
+                        for m in maintainers.maintainers(p.key))
         out += "]"
     print(out)
 
 
-def process_one(p, repo, old, new, printer, fix=False, stabilizations=False,
-                eclass_filter=None):
+def get_stable_support(pkgs, old, new):
+    """
+    Check stable versions in pkgs (sorted newest first) for support
+    for old and new implementations.  Returns a tuple of two bools:
+    whether any stable version supports old, and whether the newest
+    stable version supporting either supports new.
+    """
+    has_any_stable = False
+    for p in pkgs:
+        if get_package_class(p) == PackageClass.stable:
+            impls = (get_python_impls(p) or ())
+            if new in impls:
+                return (has_any_stable, True)
+            elif old in impls:
+                has_any_stable = True
+    return (has_any_stable, False)
+
+
+def process_one(p, repo, old, new, printer, fix=None, stabilizations=False,
+                eclass_filter=None, stable_cache=None, versions=None):
+    """
+    Process package p.  versions can be used to pass all versions
+    of the package (sorted oldest first), if they are known already.
+    """
     impls = get_python_impls(p)
     if impls is None:
         # not a Python package
@@ -52,20 +83,16 @@ def process_one(p, repo, old, new, printer, fix=False, stabilizations=False,
         return
 
     if stabilizations and new in impls:
-        # check if new is supported in stable
-        # and if any stable version supported old
-        has_in_stable = False
-        has_any_stable = False
-
-        for p in sorted(repo.filter(p.key), reverse=True):
-            if get_package_class(p) == PackageClass.stable:
-                impls = (get_python_impls(p) or ())
-                if new in impls:
-                    has_in_stable = True
-                    break
-                elif old in impls:
-                    has_any_stable = True
-
+        if stable_cache is None:
+            stable_cache = {}
+        support = stable_cache.get(p.key)
+        if support is None:
+            if versions is None:
+                versions = sorted(repo.filter(p.key))
+            support = stable_cache[p.key] = get_stable_support(
+                reversed(versions), old, new)
+
+        has_any_stable, has_in_stable = support
         if has_any_stable:
             if not has_in_stable:
                 printer(p)
@@ -74,25 +101,15 @@ def process_one(p, repo, old, new, printer, fix=False, stabilizations=False,
         if new not in impls:
             printer(p)
 
-            if fix:
-                upd_list = []
-
+            if fix is not None:
                 for p in sorted(repo.filter(p.key), reverse=True):
-                    upd_list.append(p.path)
+                    fix.add(p.path)
 
                     # update all non-keyworded (possibly live) ebuilds
                     # and the newest keyworded ebuild, then stop
                     if get_package_class(p) != PackageClass.non_keyworded:
                         break
 
-                for path in upd_list:
-                    try:
-                        with EbuildMangler(path) as em:
-                            em.add(new.r1_name)
-                    except Exception as e:
-                        sys.stderr.write("%s%s%s\n"
-                                         % (ANSI.brown, str(e), ANSI.reset))
-
             return True
     return False
 
@@ -100,75 +117,99 @@ def process_one(p, repo, old, new, printer, fix=False, stabilizations=False,
 usedep_re = re.compile(r"^(?P<pkg>[^\[]*)(?:\[(?P<flags>[^:]*)\])?(?:::.*)?$")
 
 
-def process_dep(repo, dep, func, package_cache):
-    if not isinstance(dep, PMAtom):
-        for d in dep:
-            process_dep(repo, d, func, package_cache)
-    else:
-        if dep.blocking:
-            return
-
-        # only packages with use-deps are interesting to us
-        # (hack copied from gpy-depcheck)
-        m = usedep_re.match(str(dep))
-        flags = (m.group("flags") or "").split(",")
-        for f in flags:
-            if f.startswith("python_targets_"):
-                # ok, dep's there
-                break
-        else:
-            return
-
-        pkg = repo.select(m.group("pkg"))
-        assert pkg
-        if pkg not in package_cache:
-            package_cache.add(pkg)
-            if func(pkg):
-                process_pkg_deps(repo, pkg, func, package_cache)
-
-
-def process_pkg_deps(repo, p, f, package_cache):
-    dep_groups = (p.run_dependencies, p.build_dependencies,
-                  p.post_dependencies)
-    if hasattr(p, "cbuild_build_dependencies"):
-        dep_groups += (p.cbuild_build_dependencies,)
-    for dg in dep_groups:
-        for dep in dg:
-            process_dep(repo, dep, f, package_cache)
+def select_dep(repo, dep):
+    """Select the package matching a PYTHON_USEDEP dependency, or None"""
+    if dep.blocking:
+        return None
 
+    # only packages with use-deps are interesting to us
+    # (hack copied from gpy-depcheck)
+    m = usedep_re.match(str(dep))
+    flags = (m.group("flags") or "").split(",")
+    if not any(f.startswith("python_targets_") for f in flags):
+        return None
 
-def process(repo, pkgs, old, new, printer, fix=False, stabilizations=False,
-            deps=False, package_cache=None, eclass_filter=None):
+    pkg = repo.select(m.group("pkg"))
+    assert pkg
+    return pkg
+
+
+def process_pkg_deps(repo, p, f, package_cache, atom_cache=None):
+    """
+    Call f on all dependencies of p with PYTHON_USEDEP, breadth-first,
+    descending into dependencies of packages for which f returned true.
+    package_cache holds the packages processed already, atom_cache
+    memoizes select_dep() results.
+    """
+    if atom_cache is None:
+        atom_cache = {}
+
+    queue = collections.deque([p])
+    while queue:
+        for dep in iter_dep_atoms(queue.popleft()):
+            dep_str = str(dep)
+            try:
+                pkg = atom_cache[dep_str]
+            except KeyError:
+                pkg = atom_cache[dep_str] = select_dep(repo, dep)
+            if pkg is not None and pkg not in package_cache:
+                package_cache.add(pkg)
+                if f(pkg):
+                    queue.append(pkg)
+
+
+def process(repo, pkgs, old, new, printer, fix=None, stabilizations=False,
+            deps=False, package_cache=None, eclass_filter=None,
+            stable_cache=None, atom_cache=None, all_versions=False):
     total_upd = 0
     total_pkg = 0
+    if stable_cache is None:
+        stable_cache = {}
+    if atom_cache is None:
+        atom_cache = {}
 
     sys.stderr.write("%s%sWaiting for PM to start iterating...%s\r"
                      % (ANSI.clear_line, ANSI.brown, ANSI.reset))
 
-    for pg in group_packages(pkgs, key="slotted_atom"):
-        sys.stderr.write("%s%s%-40s%s (%s%4d%s of %s%4d%s need checking)\r"
-                         % (ANSI.clear_line, ANSI.green, pg[0].key, ANSI.reset,
-                            ANSI.white, total_upd, ANSI.reset,
-                            ANSI.white, total_pkg, ANSI.reset))
-
-        p = pg[-1]
-        r = process_one(p, repo, old, new,
-                        printer=printer,
-                        fix=fix,
-                        stabilizations=stabilizations,
-                        eclass_filter=eclass_filter)
-
-        if r is None:
-            continue
-        total_pkg += 1
-        if r:
-            total_upd += 1
-            if deps:
-                process_pkg_deps(
-                    repo, p, functools.partial(
-                        process_one, repo=repo, old=old, new=new, fix=fix,
-                        stabilizations=stabilizations, printer=printer),
-                    package_cache)
+    slot_groups = group_packages(pkgs, key="slotted_atom")
+    for key, key_groups in itertools.groupby(slot_groups,
+                                             key=lambda pg: pg[0].key):
+        key_groups = list(key_groups)
+        # when processing the whole repository (possibly filtered
+        # by maintainer), we already have all versions of the package,
+        # in order
+        versions = None
+        if stabilizations and all_versions:
+            versions = list(itertools.chain.from_iterable(key_groups))
+
+        for pg in key_groups:
+            sys.stderr.write(
+                "%s%s%-40s%s (%s%4d%s of %s%4d%s need checking)\r"
+                % (ANSI.clear_line, ANSI.green, key, ANSI.reset,
+                   ANSI.white, total_upd, ANSI.reset,
+                   ANSI.white, total_pkg, ANSI.reset))
+
+            p = pg[-1]
+            r = process_one(p, repo, old, new,
+                            printer=printer,
+                            fix=fix,
+                            stabilizations=stabilizations,
+                            eclass_filter=eclass_filter,
+                            stable_cache=stable_cache,
+                            versions=versions)
+
+            if r is None:
+                continue
+            total_pkg += 1
+            if r:
+                total_upd += 1
+                if deps:
+                    process_pkg_deps(
+                        repo, p, functools.partial(
+                            process_one, repo=repo, old=old, new=new,
+                            fix=fix, stabilizations=stabilizations,
+                            printer=printer, stable_cache=stable_cache),
+                        package_cache, atom_cache)
 
     sys.stderr.write("%s%sDone.%s\n"
                      % (ANSI.clear_line, ANSI.white, ANSI.reset))
@@ -189,6 +230,18 @@ def main(prog_name, *argv):
                      help="Include the dependencies of specified packages")
     opt.add_argument("-e", "--eclass-filter",
                      help="Include only ebuild using specified eclass(es)")
+    opt.add_argument("--herd", action="append", default=[],
+                     help="Include only packages maintained by specified "
+                          "project (formerly herd), e.g. python")
+    opt.add_argument("-j", "--jobs", type=int,
+                     help="Number of ebuilds to update in parallel "
+                          "with --fix")
+    opt.add_argument("--journal",
+                     help="Record ebuilds to update with --fix in specified "
+                          "file, and resume an interrupted run from it")
+    opt.add_argument("--maintainer", action="append", default=[],
+                     help="Include only packages maintained by specified "
+                          "person/project (by e-mail)")
     opt.add_argument("-m", "--maintainers", action="store_true",
                      help="Print maintainers of listed packages")
     opt.add_argument("-p", "--print-path", action="store_const",
@@ -219,24 +272,79 @@ def main(prog_name, *argv):
     if vals.eclass_filter:
         eclass_filter = vals.eclass_filter.split(",")
 
-    if not vals.package:
-        process(pm.repositories[vals.repo], pm.repositories[vals.repo],
-                old, new, fix=vals.fix, stabilizations=vals.stabilizations,
-                eclass_filter=eclass_filter,
-                printer=lambda p: print_package(p,
-                                                maintainers=vals.maintainers,
-                                                pkg_print=vals.pkg_print))
-    else:
-        package_cache = set()
-        for pkg in vals.package:
-            process(pm.repositories[vals.repo],
-                    pm.repositories[vals.repo].filter(pkg), old, new,
-                    fix=vals.fix, stabilizations=vals.stabilizations,
-                    package_cache=package_cache, deps=vals.depends,
-                    eclass_filter=eclass_filter,
-                    printer=lambda p: print_package(
-                        p, maintainers=vals.maintainers,
-                        pkg_print=vals.pkg_print))
+    if vals.journal is not None and not vals.fix:
+        opt.error("--journal requires --fix")
+
+    maint_filter = [*vals.maintainer, *map(herd_email, vals.herd)]
+
+    with contextlib.ExitStack() as exit_stack:
+        fix = None
+        if vals.fix:
+            # arguments determining the set of ebuilds to update
+            operation = {
+                "add": new.r1_name,
+                "old": old.r1_name,
+                "repo": vals.repo,
+                "package": vals.package,
+                "depends": vals.depends,
+                "eclass_filter": eclass_filter,
+                "maintainer": maint_filter,
+            }
+            try:
+                fix = exit_stack.enter_context(
+                    EbuildTransaction(lambda em: em.add(new.r1_name),
+                                      journal=vals.journal, jobs=vals.jobs,
+                                      operation=operation))
+            except ValueError as e:
+                opt.error(str(e))
+
+        repo = pm.repositories[vals.repo]
+        maint_index = None
+        if vals.maintainers or vals.maintainer or vals.herd:
+            maint_index = MaintainerIndex(repo.path)
+        maintainers = maint_index if vals.maintainers else None
+        stable_cache = {}
+        if fix is not None and fix.planned:
+            sys.stderr.write(f"{ANSI.white}Resuming from journal, "
+                             f"{len(fix.paths)} ebuilds to update"
+                             f"{ANSI.reset}\n")
+        elif not vals.package:
+            pkgs = repo
+            if maint_filter:
+                pkgs = maint_index.filter(repo, maint_filter)
+            process(repo, pkgs,
+                    old, new, fix=fix, stabilizations=vals.stabilizations,
+                    eclass_filter=eclass_filter, stable_cache=stable_cache,
+                    all_versions=True,
+                    printer=lambda p: print_package(p,
+                                                    maintainers=maintainers,
+                                                    pkg_print=vals.pkg_print))
+        else:
+            package_cache = set()
+            atom_cache = {}
+            for pkg in vals.package:
+                pkgs = repo.filter(pkg)
+                if maint_filter:
+                    pkgs = maint_index.filter(pkgs, maint_filter)
+                process(repo,
+                        pkgs, old, new,
+                        fix=fix, stabilizations=vals.stabilizations,
+                        package_cache=package_cache, atom_cache=atom_cache,
+                        deps=vals.depends,
+                        eclass_filter=eclass_filter, stable_cache=stable_cache,
+                        printer=lambda p: print_package(
+                            p, maintainers=maintainers,
+                            pkg_print=vals.pkg_print))
+
+        if fix is not None:
+            fix.finish_plan()
+            errors = fix.commit()
+            for path, e in errors:
+                sys.stderr.write(f"{ANSI.brown}{path}: {e}{ANSI.reset}\n")
+            if errors:
+                sys.stderr.write(
+                    f"{ANSI.red}No ebuilds were updated.{ANSI.reset}\n")
+                return 1
 
     return 0
 
@@ -3,13 +3,16 @@
 # (c) 2022-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import argparse
 import collections
+import enum
 import importlib.metadata
-import itertools
 import json
 import os.path
+import re
 import subprocess
 import sys
+import typing
 
 from gentoopm import get_package_manager
 from gentoopm.basepm.atom import PMAtom
@@ -17,6 +20,8 @@ from packaging.requirements import Requirement
 from packaging.utils import canonicalize_name
 
 from gpyutils.ansi import ANSI
+from gpyutils.output import record_writers
+from gpyutils.vdb import Vdb, VdbAtom
 
 PYTHON_QUERY_SCRIPT = b"""
 import json
@@ -45,8 +50,85 @@ output = {
 json.dump(output, sys.stdout)
 """
 
-
-def process(pkgs):
+PYVER_RE = re.compile(r"(?P<impl>python|pypy)(?P<version>\d+\.\d+)")
+
+
+class FindingKind(enum.Enum):
+    missing_dist = "missing package providing distribution"
+    missing_dep = "missing dependency"
+    missing_usedep = "missing PYTHON_USEDEP on"
+
+
+class Finding(typing.NamedTuple):
+    package: str
+    dist: str
+    dependency: str
+    kind: FindingKind
+    python_versions: list[str]
+    # whether all Python versions the dist is installed for are affected
+    all_pythons: bool
+
+    def as_dict(self) -> dict:
+        return dict(self._asdict(), kind=self.kind.name)
+
+
+def query_python_env(pyver: str) -> dict:
+    """Get marker environment by running the Python interpreter"""
+    subp = subprocess.Popen([pyver, "-"],
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+    stdout, _ = subp.communicate(PYTHON_QUERY_SCRIPT)
+    assert subp.returncode == 0
+    return json.loads(stdout)
+
+
+class StaticPythonEnv:
+    """Derive marker environment from vdb, without running Python"""
+
+    def __init__(self, vdb: Vdb) -> None:
+        self.vdb = vdb
+
+    def __call__(self, pyver: str) -> dict:
+        m = PYVER_RE.fullmatch(pyver)
+        assert m is not None, f"Unexpected Python version: {pyver}"
+        impl = m.group("impl")
+        version = m.group("version")
+
+        pkg_key = "dev-lang/python" if impl == "python" else "dev-lang/pypy"
+        pkgs = [p for p in self.vdb.filter(pkg_key) if p.slot == version]
+        full_version = f"{version}.0"
+        chost = ""
+        if pkgs:
+            chost = pkgs[0].chost
+            if impl == "python":
+                # strip _p*, _rc* and -r* suffixes
+                full_version = re.split(r"[_-]", pkgs[0].version, 1)[0]
+
+        epython = pyver
+        # PyPy3.10 and older used the plain "pypy3" name
+        if impl == "pypy" and tuple(map(int, version.split("."))) < (3, 11):
+            epython = "pypy3"
+
+        # see PYTHON_QUERY_SCRIPT
+        return {
+            "EPYTHON": epython,
+            "implementation_name": "cpython" if impl == "python" else "pypy",
+            "implementation_version": full_version,
+            "os_name": "posix",
+            "platform_machine": chost.split("-", 1)[0],
+            "platform_release": "",
+            "platform_system": "Linux",
+            "platform_version": "",
+            "python_full_version": full_version,
+            "platform_python_implementation":
+                "CPython" if impl == "python" else "PyPy",
+            "python_version": version,
+            "sys_platform": "linux",
+        }
+
+
+def process(pkgs, get_python_env=query_python_env,
+            ) -> typing.Generator[Finding, None, None]:
     sys.stderr.write(f"{ANSI.cyan}Populating package cache...{ANSI.reset}\n")
 
     dist_info_map = {}
@@ -104,12 +186,7 @@ def process(pkgs):
     python_envs = {}
     epythons = {}
     for p in python_versions:
-        subp = subprocess.Popen([p, "-"],
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE)
-        stdout, _ = subp.communicate(PYTHON_QUERY_SCRIPT)
-        assert subp.returncode == 0
-        env = json.loads(stdout)
+        env = get_python_env(p)
         env["extra"] = ""
         epythons[p] = env.pop("EPYTHON")
         python_envs[p] = env
@@ -140,6 +217,7 @@ def process(pkgs):
             f"{ANSI.white}{len(dist_info_map):4}{ANSI.reset})\r")
 
         dist = importlib.metadata.Distribution.at(distinfo)
+        dist_name = canonicalize_name(dist.name)
         expected_deps = set()
         for r in dist.requires or ():
             parsed_req = Requirement(r)
@@ -149,7 +227,7 @@ def process(pkgs):
             dep_name = canonicalize_name(parsed_req.name)
             matched_pkg = dist_name_map[dep_name].get(pyver, None)
             if matched_pkg is None:
-                missing_dists[dist.name][dep_name].add(pyver)
+                missing_dists[dist_name][dep_name].add(pyver)
                 continue
             matched_dep = str(matched_pkg.key)
             # map dev-python/pypy3_* subpackages into the common
@@ -161,7 +239,7 @@ def process(pkgs):
         expected_usedeps = set(expected_deps)
 
         def process_deps(dep):
-            if not isinstance(dep, PMAtom):
+            if not isinstance(dep, (PMAtom, VdbAtom)):
                 for x in dep:
                     process_deps(x)
             else:
@@ -178,59 +256,75 @@ def process(pkgs):
 
         process_deps((pkg.run_dependencies, pkg.post_dependencies))
         for dep in expected_deps:
-            missing_deps[dist.name][dep].add(pyver)
+            missing_deps[dist_name][dep].add(pyver)
             # report each dep only once
             expected_usedeps.discard(dep)
         # special case: dev-python/pypy3 provides (cffi, hpy)
         if pyflag == "pypy3":
             expected_usedeps.discard("dev-python/pypy3")
         for dep in expected_usedeps:
-            missing_usedeps[dist.name][dep].add(pyver)
+            missing_usedeps[dist_name][dep].add(pyver)
 
     sys.stderr.write(
         f"{ANSI.clear_line}{ANSI.white}Done.{ANSI.reset}\n")
 
-    for dist_name, data in sorted(missing_dists.items()):
-        for dep, allpyvers in data.items():
-            for pkg, pyvers in itertools.groupby(
-                    allpyvers, lambda x: dist_name_map[dist_name].get(x)):
-                if pkg is None:
-                    continue
-                pyvers = set(pyvers)
-                if pyvers == set(dist_name_map[dist_name]):
-                    pyvers = ["*"]
-                print(f"{pkg}: missing package providing distribution: {dep} "
-                      f"[{' '.join(sorted(pyvers))}]")
-
-    for dist_name, data in sorted(missing_deps.items()):
-        for dep, allpyvers in data.items():
-            for pkg, pyvers in itertools.groupby(
-                    allpyvers, lambda x: dist_name_map[dist_name].get(x)):
-                if pkg is None:
-                    continue
-                pyvers = set(pyvers)
-                if pyvers == set(dist_name_map[dist_name]):
-                    pyvers = ["*"]
-                print(f"{pkg}: missing dependency: {dep} "
-                      f"[{' '.join(sorted(pyvers))}]")
-
-    for dist_name, data in sorted(missing_usedeps.items()):
-        for dep, allpyvers in data.items():
-            for pkg, pyvers in itertools.groupby(
-                    allpyvers, lambda x: dist_name_map[dist_name].get(x)):
-                if pkg is None:
-                    continue
-                pyvers = set(pyvers)
-                if pyvers == set(dist_name_map[dist_name]):
-                    pyvers = ["*"]
-                print(f"{pkg}: missing PYTHON_USEDEP on: {dep} "
-                      f"[{' '.join(sorted(pyvers))}]")
+    for kind, missing in ((FindingKind.missing_dist, missing_dists),
+                          (FindingKind.missing_dep, missing_deps),
+                          (FindingKind.missing_usedep, missing_usedeps)):
+        for dist_name, data in sorted(missing.items()):
+            all_pyvers = frozenset(dist_name_map[dist_name])
+            for dep, allpyvers in sorted(data.items()):
+                pkg_pyvers = collections.defaultdict(set)
+                for pyver in allpyvers:
+                    pkg = dist_name_map[dist_name].get(pyver)
+                    if pkg is not None:
+                        pkg_pyvers[pkg].add(pyver)
+                for pkg, pyvers in sorted(pkg_pyvers.items(),
+                                          key=lambda x: str(x[0])):
+                    yield Finding(package=str(pkg),
+                                  dist=dist_name,
+                                  dependency=dep,
+                                  kind=kind,
+                                  python_versions=sorted(pyvers),
+                                  all_pythons=(pyvers == all_pyvers))
 
 
 def main(prog_name, *argv):
-    pm = get_package_manager()
-    process(pm.installed)
-    return 0
+    argp = argparse.ArgumentParser(prog=prog_name)
+    argp.add_argument("-f", "--format",
+                      choices=["text", *record_writers],
+                      default="text",
+                      help="Output format (default: text)")
+    argp.add_argument("--root",
+                      help="Scan packages installed in given ROOT "
+                           "(e.g. unpacked container image) instead of "
+                           "the running system, without executing "
+                           "its Python interpreters")
+    args = argp.parse_args(list(argv))
+
+    if args.root is not None:
+        vdb = Vdb(args.root)
+        findings = process(vdb, get_python_env=StaticPythonEnv(vdb))
+    else:
+        pm = get_package_manager()
+        findings = process(pm.installed)
+
+    found = False
+    if args.format == "text":
+        for finding in findings:
+            pyvers = (["*"] if finding.all_pythons
+                      else finding.python_versions)
+            print(f"{finding.package}: {finding.kind.value}: "
+                  f"{finding.dependency} [{' '.join(pyvers)}]")
+            found = True
+    else:
+        with record_writers[args.format](sys.stdout) as writer:
+            for finding in findings:
+                writer.write(finding.as_dict())
+                found = True
+
+    # non-zero exit status indicates that issues were found
+    return 1 if found else 0
 
 
 def entry_point():
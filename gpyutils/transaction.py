@@ -0,0 +1,176 @@
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Modifying PYTHON_COMPAT in multiple ebuilds as a single transaction"""
+
+import concurrent.futures
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import typing
+
+from .pycompat import EbuildMangler
+
+
+class EbuildTransaction:
+    """
+    A set of ebuilds whose PYTHON_COMPAT is modified together.
+
+    Ebuilds are added via add(), and func is called with an EbuildMangler
+    instance for each of them on commit().  The updated ebuilds are first
+    staged as temporary files in parallel.  If that fails for any ebuild,
+    nothing is modified.  Otherwise, the ebuilds are replaced via renames,
+    and the ones replaced already are restored if that fails.
+
+    If journal is specified, the ebuilds are recorded in it (as JSON lines)
+    as they are added, and once the scan is complete.  The journal starts
+    with a record of operation, that is a dict describing the change made
+    by func and the arguments used to find the ebuilds.  If the journal
+    exists already, the ebuilds from it are added again, and planned is
+    set if the scan was complete, to resume an interrupted run.  ValueError
+    is raised if the journal was written for a different operation.  func
+    must be idempotent for that to work.  If the commit fails, the errors are
+    recorded and the transaction is marked as aborted, so that the next
+    run starts over rather than replaying the failure.  The journal is
+    removed on successful commit.
+
+    The transaction should be used as a context manager, to ensure that
+    the journal is closed.
+    """
+
+    def __init__(self,
+                 func: typing.Callable[[EbuildMangler], None],
+                 journal: str | None = None,
+                 jobs: int | None = None,
+                 operation: dict | None = None,
+                 ) -> None:
+        self.func = func
+        self.jobs = jobs
+        self.journal_path = journal
+        self.journal_fd = None
+        # dict is used as an ordered set
+        self.paths = {}
+        self.planned = False
+        operation = operation or {}
+
+        if journal is not None:
+            journal_operation = None
+            with contextlib.suppress(FileNotFoundError), open(journal) as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record["op"] == "begin":
+                        del record["op"]
+                        journal_operation = record
+                    elif record["op"] == "add":
+                        self.paths[record["path"]] = None
+                    elif record["op"] == "planned":
+                        self.planned = True
+                    elif record["op"] == "aborted":
+                        journal_operation = None
+                        self.paths.clear()
+                        self.planned = False
+            if (self.paths or self.planned) and (
+                    journal_operation != operation):
+                raise ValueError(
+                    f"journal {journal} was written for a different "
+                    f"operation: {journal_operation}")
+            # records are written unbuffered, and synced immediately
+            self.journal_fd = os.open(
+                journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+            if journal_operation is None:
+                self._record(op="begin", **operation)
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _record(self, **kwargs: typing.Any) -> None:
+        if self.journal_fd is not None:
+            os.write(self.journal_fd, (json.dumps(kwargs) + "\n").encode())
+            os.fsync(self.journal_fd)
+
+    def _abort(self, errors: list[tuple[str, Exception]]) -> None:
+        for path, e in errors:
+            self._record(op="failed", path=path, error=str(e))
+        self._record(op="aborted")
+
+    def add(self, path: str) -> None:
+        path = os.path.abspath(path)
+        if path not in self.paths:
+            self.paths[path] = None
+            self._record(op="add", path=path)
+
+    def finish_plan(self) -> None:
+        """Record that all ebuilds were added"""
+        if not self.planned:
+            self.planned = True
+            self._record(op="planned")
+
+    def _stage(self, path: str) -> tuple[str, str]:
+        """Stage the update, return the temporary path and original data"""
+        em = EbuildMangler(path)
+        self.func(em)
+        return (em.stage(), em.original_data)
+
+    def commit(self) -> list[tuple[str, Exception]]:
+        """Apply the updates, return a list of (path, error) on failure"""
+        staged = {}
+        errors = []
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as executor:
+            futures = {executor.submit(self._stage, path): path
+                       for path in self.paths}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    staged[futures[future]] = future.result()
+                except (KeyError, OSError, ValueError) as e:
+                    errors.append((futures[future], e))
+
+        if errors:
+            for tmp_path, _ in staged.values():
+                os.unlink(tmp_path)
+            errors.sort(key=lambda x: x[0])
+            self._abort(errors)
+            return errors
+
+        committed = []
+        try:
+            for path in self.paths:
+                os.rename(staged[path][0], path)
+                committed.append(path)
+        except BaseException as e:
+            for path in committed:
+                restore_ebuild(path, staged[path][1])
+            for path in list(self.paths)[len(committed):]:
+                os.unlink(staged[path][0])
+            # an interrupted commit can be resumed from the journal
+            if not isinstance(e, OSError):
+                raise
+            errors = [(list(self.paths)[len(committed)], e)]
+            self._abort(errors)
+            return errors
+
+        self.close()
+        if self.journal_path is not None:
+            os.unlink(self.journal_path)
+        return []
+
+    def close(self) -> None:
+        if self.journal_fd is not None:
+            os.close(self.journal_fd)
+            self.journal_fd = None
+
+
+def restore_ebuild(path: str, data: str) -> None:
+    """Atomically restore the original ebuild contents"""
+    with tempfile.NamedTemporaryFile(
+            "wb", dir=os.path.dirname(path), delete=False) as f:
+        tmp_path = f.name
+        f.write(data.encode("utf8"))
+
+    shutil.copymode(path, tmp_path)
+    os.rename(tmp_path, path)
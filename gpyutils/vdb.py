@@ -0,0 +1,158 @@
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Read-only access to installed package database of an arbitrary ROOT"""
+
+import os
+import os.path
+import re
+import typing
+
+VERSION_RE = (r"\d+(?:\.\d+)*[a-z]?"
+              r"(?:_(?:alpha|beta|pre|rc|p)\d*)*"
+              r"(?:-r\d+)?")
+
+PF_RE = re.compile(rf"(?P<pn>.+?)-(?P<pvr>{VERSION_RE})")
+
+ATOM_RE = re.compile(
+    r"(?P<blocker> !{0,2})"
+    r"(?P<op> [<>]?= | [<>~])?"
+    r"(?P<key> [^\s/:\[]+ / [^\s:\[]+?)"
+    rf"(?: - (?P<version> {VERSION_RE}) [*]?)?"
+    r"(?: : (?P<slot> [^\s:\[]+))?"
+    r"(?: :: [^\s\[]+)?"
+    r"(?: \[ (?P<usedep> [^\]]*) \])?",
+    re.VERBOSE)
+
+
+class VdbAtom:
+    """
+    A dependency atom read from the vdb.
+
+    >>> VdbAtom(">=dev-python/foo-bar-1.2-r1:0=[python_targets_pypy3]").key
+    'dev-python/foo-bar'
+    >>> VdbAtom("!!dev-python/foo").blocking
+    True
+    >>> str(VdbAtom("dev-python/foo:3.12[a,b(-)?]"))
+    'dev-python/foo:3.12[a,b(-)?]'
+    >>> VdbAtom("foo")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid atom: foo
+    """
+
+    def __init__(self, atom: str) -> None:
+        m = ATOM_RE.fullmatch(atom)
+        if m is None or bool(m.group("op")) != bool(m.group("version")):
+            raise ValueError(f"Invalid atom: {atom}")
+        self._atom = atom
+        self.key = m.group("key")
+        self.blocking = bool(m.group("blocker"))
+
+    def __str__(self) -> str:
+        return self._atom
+
+    def __repr__(self) -> str:
+        return f"VdbAtom({self._atom!r})"
+
+
+def parse_dependencies(depstr: str) -> list[VdbAtom]:
+    """
+    Parse a dependency string into a flat list of atoms.
+
+    The vdb stores dependencies with USE conditionals already
+    evaluated, so the remaining grouping is not relevant to us.
+
+    >>> parse_dependencies("a/b || ( c/d >=e/f-1 ) flag? ( g/h )")
+    [VdbAtom('a/b'), VdbAtom('c/d'), VdbAtom('>=e/f-1'), VdbAtom('g/h')]
+    """
+    return [VdbAtom(x) for x in depstr.split()
+            if x not in ("||", "(", ")") and not x.endswith("?")]
+
+
+class VdbPackage:
+    """An installed package, as found in the vdb of ROOT"""
+
+    def __init__(self, root: str, path: str) -> None:
+        self.root = root
+        self.path = path
+        category, pf = path.rsplit(os.path.sep, 2)[-2:]
+        m = PF_RE.fullmatch(pf)
+        if m is None:
+            raise ValueError(f"Invalid vdb entry: {path}")
+        self.cpv = f"{category}/{pf}"
+        self.key = f"{category}/{m.group('pn')}"
+        self.version = m.group("pvr")
+
+    def _read(self, name: str) -> str:
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    @property
+    def slot(self) -> str:
+        return self._read("SLOT").split("/", 1)[0]
+
+    @property
+    def chost(self) -> str:
+        return self._read("CHOST")
+
+    @property
+    def contents(self) -> typing.Generator[str, None, None]:
+        """Files installed by the package, with ROOT prepended"""
+        with open(os.path.join(self.path, "CONTENTS")) as f:
+            for line in f:
+                if not line.startswith("obj "):
+                    continue
+                # obj <path> <md5> <mtime>
+                path = line[4:].rsplit(" ", 2)[0]
+                yield os.path.join(self.root, path.lstrip("/"))
+
+    @property
+    def run_dependencies(self) -> list[VdbAtom]:
+        return parse_dependencies(self._read("RDEPEND"))
+
+    @property
+    def post_dependencies(self) -> list[VdbAtom]:
+        return parse_dependencies(self._read("PDEPEND"))
+
+    def __str__(self) -> str:
+        repo = self._read("repository")
+        if repo:
+            return f"={self.cpv}::{repo}"
+        return f"={self.cpv}"
+
+    def __repr__(self) -> str:
+        return f"VdbPackage({self.root!r}, {self.path!r})"
+
+
+class Vdb:
+    """The installed package database of given ROOT"""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.path = os.path.join(root, "var", "db", "pkg")
+        if not os.path.isdir(self.path):
+            raise FileNotFoundError(f"No package database in {root}")
+
+    def _iter_category(self, category: str,
+                       ) -> typing.Generator[VdbPackage, None, None]:
+        cat_path = os.path.join(self.path, category)
+        if not os.path.isdir(cat_path):
+            return
+        for pf in sorted(os.listdir(cat_path)):
+            # skip merge-in-progress entries (-MERGING-foo)
+            if pf.startswith("-"):
+                continue
+            yield VdbPackage(self.root, os.path.join(cat_path, pf))
+
+    def __iter__(self) -> typing.Generator[VdbPackage, None, None]:
+        for category in sorted(os.listdir(self.path)):
+            yield from self._iter_category(category)
+
+    def filter(self, key: str) -> list[VdbPackage]:
+        return [p for p in self._iter_category(key.split("/", 1)[0])
+                if p.key == key]
@@ -4,7 +4,8 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import argparse
-import collections
+import datetime
+import html
 import itertools
 import sys
 
@@ -52,118 +53,240 @@ EPILOGUE = """
 """
 
 
+SVG_PROLOGUE = """<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8"/>
+    <title>{title}</title>
+    <style>
+      body {{ font-family: sans-serif; font-size: 12px; }}
+      rect:hover {{ stroke: black; }}
+    </style>
+  </head>
+  <body>
+    <svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">
+"""
+
+SVG_EPILOGUE = """    </svg>
+  </body>
+</html>
+"""
+
+SVG_LABEL_WIDTH = 160
+SVG_ROW_HEIGHT = 24
+SVG_AXIS_HEIGHT = 24
+SVG_DAY_WIDTH = 0.1
+
+SVG_COLORS = {
+    "dev": "#cccccc",
+    "α": "#f4b6c2",
+    "β": "#f7d794",
+    "rc": "#f5cd79",
+    "stable": "#78e08f",
+    "security": "#e58e26",
+    "eol": "#b71540",
+    "future": "#eeeeee",
+    "~arch": "#82ccdd",
+    "python.eclass": "#b8e994",
+    "default": "#38ada9",
+    "old": "#e55039",
+    "removal": "#6a89cc",
+}
+
+# placeholder for the end date of the newest versions, that is
+# the newest EOL date found in the data
+FUTURE = object()
+
+
 def jsdate(dt):
     return f"{dt.year}, {dt.month - 1}, {dt.day}"
 
 
-def print_row(row_label, bars, f):
-    prev = None
-    for label, start_date in bars:
-        if prev is not None:
-            print(f"          [ {row_label!r}, {prev[0]!r}, "
-                  f"new Date({jsdate(prev[1])}), "
-                  f"new Date({jsdate(start_date)}) ],",
-                  file=f)
-        prev = (label, start_date)
+def iter_spans(bars):
+    """Yield (label, start, end) tuples for consecutive bars"""
+    for (label, start_date), (_, end_date) in itertools.pairwise(bars):
+        yield (label, start_date, end_date)
+
+
+def format_row(row_label, bars):
+    return "".join(f"          [ {row_label!r}, {label!r}, "
+                   f"new Date({jsdate(start_date)}), "
+                   f"new Date({jsdate(end_date)}) ],\n"
+                   for label, start_date, end_date in iter_spans(bars))
+
+
+def format_svg(rows):
+    """Render rows as an inline SVG timeline"""
+    min_date = min(bars[0][1] for _, bars in rows)
+    max_date = max(bars[-1][1] for _, bars in rows)
+
+    def x(date):
+        return SVG_LABEL_WIDTH + (date - min_date).days * SVG_DAY_WIDTH
+
+    out = []
+    # year grid
+    for year in range(min_date.year + 1, max_date.year + 1):
+        pos = x(datetime.date(year, 1, 1))
+        out.append(f'      <line x1="{pos:.1f}" y1="{SVG_AXIS_HEIGHT - 6}" '
+                   f'x2="{pos:.1f}" '
+                   f'y2="{SVG_AXIS_HEIGHT + len(rows) * SVG_ROW_HEIGHT}" '
+                   f'stroke="#dddddd"/>\n'
+                   f'      <text x="{pos:.1f}" y="{SVG_AXIS_HEIGHT - 10}" '
+                   f'text-anchor="middle">{year}</text>\n')
+    for i, (row_label, bars) in enumerate(rows):
+        y = SVG_AXIS_HEIGHT + i * SVG_ROW_HEIGHT
+        out.append(f'      <text x="4" y="{y + 16}">'
+                   f'{html.escape(row_label)}</text>\n')
+        for label, start_date, end_date in iter_spans(bars):
+            color = SVG_COLORS.get(label, "#999999")
+            title = html.escape(f"{row_label}: {label}, {start_date} "
+                                f"to {end_date}")
+            out.append(f'      <rect x="{x(start_date):.1f}" y="{y + 2}" '
+                       f'width="{x(end_date) - x(start_date):.1f}" '
+                       f'height="{SVG_ROW_HEIGHT - 4}" fill="{color}">'
+                       f"<title>{title}</title></rect>\n")
+    return ("".join(out),
+            x(max_date) + 4,
+            SVG_AXIS_HEIGHT + len(rows) * SVG_ROW_HEIGHT)
 
 
 def version_key(version):
     return tuple(int(x) for x in version.split("."))
 
 
+def get_upstream_bars(vdata):
+    bars = []
+    if "dev" in vdata:
+        bars.append(("dev", vdata["dev"]))
+    bars.extend(
+        [("α", vdata["alpha1"]),
+         ("β", vdata["beta1"]),
+         ("rc", vdata["rc1"]),
+         ("stable", vdata["final"])])
+    if "last-bugfix" in vdata:
+        bars.append(("security", vdata["last-bugfix"]))
+    if "eol" in vdata and vdata["eol"] != vdata["last-bugfix"]:
+        bars.append(("eol", vdata["eol"]))
+    return bars
+
+
+def get_package_bars(vdata):
+    bars = []
+    if "testing" in vdata:
+        bars.append(("~arch", vdata["testing"]))
+    if "stable" in vdata:
+        bars.append(("stable", vdata["stable"]))
+    if "removal" in vdata:
+        bars.append(("removal", vdata["removal"]))
+    else:
+        bars.append(("future", FUTURE))
+    return bars
+
+
+def get_target_bars(vdata):
+    bars = []
+    if "python-eclass" in vdata:
+        bars.append(("python.eclass", vdata["python-eclass"]))
+    if "testing" in vdata:
+        bars.append(("~arch", vdata["testing"]))
+    if "stable" in vdata:
+        bars.append(("stable", vdata["stable"]))
+    if "default" in vdata:
+        bars.append(("default", vdata["default"]))
+    if "old" in vdata:
+        bars.append(("old", vdata["old"]))
+    if "removal" in vdata:
+        bars.append(("removal", vdata["removal"]))
+    else:
+        bars.append(("future", FUTURE))
+    return bars
+
+
+def get_rows(data, upstream_only=False):
+    """Get a list of (label, bars) for all rows, in a single pass"""
+    upstream = data.get("upstream", {})
+    package = data.get("package", {})
+    target = data.get("target", {})
+
+    max_eol = None
+    rows = []
+    versions = frozenset(itertools.chain.from_iterable(data.values()))
+    for version in sorted(versions, key=version_key):
+        vdata = upstream.get(version)
+        if vdata is not None:
+            bars = get_upstream_bars(vdata)
+            if "eol" in vdata:
+                if max_eol is None:
+                    max_eol = bars[-1][1]
+                else:
+                    max_eol = max(max_eol, bars[-1][1])
+            else:
+                # use the newest EOL of older versions
+                assert max_eol is not None
+                bars.append(("future", max_eol))
+            rows.append((f"{version} upstream" if not upstream_only
+                         else version, bars))
+
+        if not upstream_only:
+            vdata = package.get(version)
+            if vdata is not None:
+                rows.append((f"{version} package", get_package_bars(vdata)))
+            vdata = target.get(version)
+            if vdata is not None:
+                rows.append((f"{version} target", get_target_bars(vdata)))
+
+    # package and target use the newest EOL of all versions
+    return [(label, [(x, max_eol if date is FUTURE else date)
+                     for x, date in bars])
+            for label, bars in rows]
+
+
 def main():
     argp = argparse.ArgumentParser()
     argp.add_argument("toml",
                       type=argparse.FileType(),
-                      help="Input TOML file")
+                      nargs="+",
+                      help="Input TOML files (values from latter files "
+                           "override these from former)")
     argp.add_argument("-o", "--output",
                       type=argparse.FileType("w"),
                       required=True,
                       help="Output HTML file")
+    argp.add_argument("--offline",
+                      action="store_true",
+                      help="Render the timeline as inline SVG, rather than "
+                           "using Google Charts (that are loaded from "
+                           "the network)")
     argp.add_argument("-u", "--upstream-only",
                       action="store_true",
                       help="Include only upstream release data")
     args = argp.parse_args()
 
-    data = toml.load(args.toml)
-    args.toml.close()
+    data = {}
+    for f in args.toml:
+        with f:
+            for table, versions in toml.load(f).items():
+                for version, vdata in versions.items():
+                    data.setdefault(table, {}).setdefault(
+                        version, {}).update(vdata)
+
+    title = ("Python release and Gentoo packaging timeline"
+             if not args.upstream_only
+             else "Python release timeline")
+    rows = get_rows(data, upstream_only=args.upstream_only)
 
     with args.output as f:
-        print(
-            PROLOGUE.replace("{title}",
-                             "Python release and Gentoo packaging timeline"
-                             if not args.upstream_only
-                             else "Python release timeline"),
-            file=f)
-
-        max_eol = None
-        all_rows = collections.defaultdict(list)
-        versions = frozenset(itertools.chain.from_iterable(data.values()))
-        for version in sorted(versions, key=version_key):
-            vdata = data.get("upstream", {}).get(version)
-            if vdata is not None:
-                bars = []
-                if "dev" in vdata:
-                    bars.append(("dev", vdata["dev"]))
-                bars.extend(
-                    [("α", vdata["alpha1"]),
-                     ("β", vdata["beta1"]),
-                     ("rc", vdata["rc1"]),
-                     ("stable", vdata["final"])])
-                if "last-bugfix" in vdata:
-                    bars.append(("security", vdata["last-bugfix"]))
-                if "eol" in vdata and vdata["eol"] != vdata["last-bugfix"]:
-                    bars.append(("eol", vdata["eol"]))
-                if "eol" in vdata:
-                    if max_eol is None:
-                        max_eol = bars[-1][1]
-                    else:
-                        max_eol = max(max_eol, bars[-1][1])
-                else:
-                    assert max_eol is not None
-                    bars.append(("future", max_eol))
-                all_rows[version].append(
-                    (f"{version} upstream" if not args.upstream_only
-                     else version, bars))
-
-        if not args.upstream_only:
-            for version in sorted(versions, key=version_key):
-                vdata = data.get("package", {}).get(version)
-                if vdata is not None:
-                    bars = []
-                    bars.append(("~arch", vdata["testing"]))
-                    if "stable" in vdata:
-                        bars.append(("stable", vdata["stable"]))
-                    if "removal" in vdata:
-                        bars.append(("removal", vdata["removal"]))
-                    else:
-                        bars.append(("future", max_eol))
-                    all_rows[version].append((f"{version} package", bars))
-
-                vdata = data.get("target", {}).get(version)
-                if vdata is not None:
-                    bars = []
-                    if "python-eclass" in vdata:
-                        bars.append(("python.eclass", vdata["python-eclass"]))
-                    if "testing" in vdata:
-                        bars.append(("~arch", vdata["testing"]))
-                    if "stable" in vdata:
-                        bars.append(("stable", vdata["stable"]))
-                    if "default" in vdata:
-                        bars.append(("default", vdata["default"]))
-                    if "old" in vdata:
-                        bars.append(("old", vdata["old"]))
-                    if "removal" in vdata:
-                        bars.append(("removal", vdata["removal"]))
-                    else:
-                        bars.append(("future", max_eol))
-                    all_rows[version].append((f"{version} target", bars))
-
-        for version in sorted(versions, key=version_key):
-            for label, bars in all_rows[version]:
-                print_row(label, bars, f)
-
-        print(EPILOGUE, file=f)
+        if args.offline:
+            svg, width, height = format_svg(rows)
+            f.write(SVG_PROLOGUE.format(title=html.escape(title),
+                                        width=f"{width:.0f}",
+                                        height=height))
+            f.write(svg)
+            f.write(SVG_EPILOGUE)
+        else:
+            f.write(PROLOGUE.replace("{title}", title) + "\n")
+            f.write("".join(format_row(label, bars) for label, bars in rows))
+            f.write(EPILOGUE + "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# gpyutils
+# (c) 2026 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Generate package and target timeline data from Gentoo git history"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+
+import toml
+
+PYTHON_DIR = "dev-lang/python"
+IMPLEMENTATIONS_TXT = "app-portage/gpyutils/files/implementations.txt"
+
+PYTHON_EBUILD_RE = re.compile(
+    rf"{PYTHON_DIR}/python-(?P<version>(?P<slot>\d+\.\d+)[^/]*)\.ebuild")
+KEYWORDS_RE = re.compile(r'KEYWORDS="(?P<keywords>[^"]*)"')
+SHORT_NAME_RE = re.compile(r"\d+\.\d+")
+
+# implementations.txt status -> target timeline key
+TARGET_KEYS = {
+    "experimental": "testing",
+    "supported": "stable",
+    "current": "default",
+    "old": "old",
+    "dead": "removal",
+}
+
+CACHE_VERSION = 1
+
+
+class TimelineState:
+    """Dates collected from the commits processed so far"""
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.commit = data.get("commit")
+        # slot -> list of ebuild paths currently present
+        self.ebuilds = data.get("ebuilds", {})
+        self.package = data.get("package", {})
+        self.target = data.get("target", {})
+
+    def as_dict(self):
+        return {
+            "version": CACHE_VERSION,
+            "commit": self.commit,
+            "ebuilds": self.ebuilds,
+            "package": self.package,
+            "target": self.target,
+        }
+
+    def add_ebuild(self, path):
+        m = PYTHON_EBUILD_RE.fullmatch(path)
+        if m is None:
+            return
+        ebuilds = self.ebuilds.setdefault(m.group("slot"), [])
+        if path not in ebuilds:
+            ebuilds.append(path)
+        # the slot was restored
+        self.package.get(m.group("slot"), {}).pop("removal", None)
+
+    def remove_ebuild(self, path, date):
+        m = PYTHON_EBUILD_RE.fullmatch(path)
+        if m is None:
+            return
+        ebuilds = self.ebuilds.get(m.group("slot"), [])
+        if path in ebuilds:
+            ebuilds.remove(path)
+            if not ebuilds and m.group("slot") in self.package:
+                self.package[m.group("slot")]["removal"] = date
+
+    def set_keywords(self, path, keywords, date):
+        m = PYTHON_EBUILD_RE.fullmatch(path)
+        if m is None:
+            return
+        keywords = keywords.split()
+        pkg = self.package.setdefault(m.group("slot"), {})
+        if "testing" not in pkg and any(x.startswith("~") for x in keywords):
+            pkg["testing"] = date
+            pkg["testing-ver"] = m.group("version")
+        if "stable" not in pkg and any(x[0] not in "~-" for x in keywords):
+            pkg["stable"] = date
+            pkg["stable-ver"] = m.group("version")
+        if not pkg:
+            del self.package[m.group("slot")]
+
+    def set_status(self, line, date):
+        fields = line.split("\t")
+        if len(fields) != 4 or not SHORT_NAME_RE.fullmatch(fields[3]):
+            return
+        key = TARGET_KEYS.get(fields[2])
+        if key is not None:
+            self.target.setdefault(fields[3], {}).setdefault(key, date)
+
+
+def process_log(stream, state):
+    """Process git log -p output, updating state"""
+    date = None
+    path = None
+    for line in stream:
+        line = line.rstrip("\n")
+        if line.startswith("\0"):
+            state.commit, date = line[1:].split()
+        elif line.startswith("diff --git "):
+            path = line.split(" b/", 1)[1]
+        elif line.startswith("new file mode"):
+            state.add_ebuild(path)
+        elif line.startswith("deleted file mode"):
+            state.remove_ebuild(path, date)
+        elif line.startswith("+") and not line.startswith("+++ "):
+            if path == IMPLEMENTATIONS_TXT:
+                state.set_status(line[1:], date)
+            else:
+                m = KEYWORDS_RE.match(line[1:])
+                if m is not None:
+                    state.set_keywords(path, m.group("keywords"), date)
+
+
+def to_toml_data(state):
+    def convert(tables):
+        return {version: {k: (datetime.date.fromisoformat(v)
+                              if not k.endswith("-ver") else v)
+                          for k, v in sorted(data.items())}
+                for version, data in sorted(
+                    tables.items(),
+                    key=lambda x: tuple(int(y) for y in x[0].split(".")))}
+
+    return {"package": convert(state.package),
+            "target": convert(state.target)}
+
+
+def main():
+    argp = argparse.ArgumentParser()
+    argp.add_argument("--cache",
+                      help="Cache file to store processed state in, "
+                           "to process only new commits on subsequent runs")
+    argp.add_argument("-o", "--output",
+                      type=argparse.FileType("w"),
+                      default=sys.stdout,
+                      help="Output TOML file (default: stdout)")
+    argp.add_argument("repo",
+                      help="Path to Gentoo git repository")
+    args = argp.parse_args()
+
+    state = TimelineState()
+    if args.cache is not None:
+        try:
+            with open(args.cache) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        else:
+            if data.get("version") == CACHE_VERSION:
+                state = TimelineState(data)
+
+    revs = "HEAD" if state.commit is None else f"{state.commit}..HEAD"
+    with subprocess.Popen(
+            ["git", "log", "--reverse", "--no-renames", "--unified=0",
+             "--format=%x00%H %cs", "-p", revs, "--",
+             PYTHON_DIR, IMPLEMENTATIONS_TXT],
+            cwd=args.repo, stdout=subprocess.PIPE,
+            encoding="utf-8", errors="replace") as git:
+        process_log(git.stdout, state)
+    if git.returncode != 0:
+        return 1
+
+    if args.cache is not None:
+        tmp_path = f"{args.cache}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state.as_dict(), f)
+        os.rename(tmp_path, args.cache)
+
+    with args.output as f:
+        toml.dump(to_toml_data(state), f)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())